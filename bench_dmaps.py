@@ -0,0 +1,291 @@
+"""Benchmarks comparing the vectorized routines in dmaps against the original pure-Python implementations they replace"""
+
+import time
+import numpy as np
+import dmaps
+import dmaps_batch
+import dmaps_native
+from test_dmaps import gen_swissroll
+
+def _loop_distances(data, metric=dmaps._l2_distance):
+    """The original per-pair construction of the distance matrix from 'dmaps.embed_data', kept as a reference"""
+    m = len(data)
+    W = np.empty([m, m])
+    for i in xrange(m):
+        W[i,i] = 0
+        for j in xrange(i+1, m):
+            W[i,j] = metric(data[i], data[j])
+            W[j,i] = W[i,j]
+    return W
+
+def bench_distances(npts=(250, 500, 1000, 2000), metrics=(dmaps._l2_distance, 'cityblock', 'cosine')):
+    """Times the construction of the pairwise distance matrix of swissroll data by the vectorized engine and by the original double loop
+
+    Args:
+        npts (list): dataset sizes to benchmark
+        metrics (list): metrics to benchmark, either functions (evaluated by the loop as-is) or scipy metric names (evaluated by the loop through scipy.spatial.distance)
+    """
+    from scipy.spatial import distance
+    swissroll = gen_swissroll()
+    for metric in metrics:
+        name = metric if isinstance(metric, str) else metric.__name__
+        loop_metric = getattr(distance, metric) if isinstance(metric, str) else metric
+        for m in npts:
+            data = swissroll[:m]
+            start = time.time()
+            D_vectorized = dmaps._pairwise_distances(data, metric)
+            vectorized_time = time.time() - start
+            start = time.time()
+            D_loop = _loop_distances(data, loop_metric)
+            loop_time = time.time() - start
+            print '%-12s m=%-6d loop: %8.3fs  vectorized: %8.4fs  speedup: %8.1fx  max abs diff: %.2e' % (name, m, loop_time, vectorized_time, loop_time/vectorized_time, np.max(np.abs(D_loop - D_vectorized)))
+
+def _dense_diagonal_embedding(W, k):
+    """The original normalization from 'dmaps._compute_embedding', which forms the dense diagonal matrix :math:`D^{-1/2}` and the product :math:`D^{-1/2} W D^{-1/2}` explicitly, kept as a reference"""
+    import scipy.sparse.linalg as spla
+    m = W.shape[0]
+    D_half_inv = np.identity(m)/np.sqrt(np.sum(W,1))
+    eigvals, eigvects = spla.eigsh(np.dot(np.dot(D_half_inv, W), D_half_inv), k=k)
+    eigvects = np.dot(D_half_inv, eigvects)
+    sorted_indices = np.argsort(np.abs(eigvals))[::-1]
+    eigvals = eigvals[sorted_indices]
+    eigvects = eigvects[:, sorted_indices]/np.linalg.norm(eigvects[:, sorted_indices], axis=0)
+    return eigvals, eigvects
+
+def _measure(fn, *args):
+    """Runs fn(*args) in a freshly forked process so that its peak memory is not polluted by earlier benchmarks
+
+    Returns:
+        elapsed (float): wall-clock time in seconds taken by fn(*args)
+        peak_rss (float): peak resident set size of the process in MB
+        result: the return value of fn(*args)
+    """
+    import multiprocessing
+    import resource
+    def target(queue):
+        start = time.time()
+        result = fn(*args)
+        elapsed = time.time() - start
+        # ru_maxrss is reported in kB on Linux
+        queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0, result))
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=target, args=(queue,))
+    process.start()
+    output = queue.get()
+    process.join()
+    return output
+
+def _normalization_run(m, k, embedding_method):
+    """Builds the swissroll kernel matrix of 'm' points and embeds it with 'embedding_method', returning the eigenvalues"""
+    data = gen_swissroll()[:m]
+    W = dmaps._pairwise_distances(data)
+    # exponentiate in place so that only the embedding step allocates additional m*m arrays
+    W *= W
+    W /= -2.0*2.0
+    np.exp(W, out=W)
+    return embedding_method(W, k)[0]
+
+def bench_normalization(npts=(1000, 2000, 4000), k=4):
+    """Compares time and peak memory of the embedding step when normalizing W with dense diagonal matrices and with the scaled LinearOperator used by 'dmaps._compute_embedding'
+
+    Args:
+        npts (list): dataset sizes to benchmark
+        k (int): number of eigenpairs to compute
+    """
+    # the kernel matrix alone occupies 8*m*m bytes
+    for m in npts:
+        dense_time, dense_rss, dense_eigvals = _measure(_normalization_run, m, k, _dense_diagonal_embedding)
+        operator_time, operator_rss, operator_eigvals = _measure(_normalization_run, m, k, dmaps._compute_embedding)
+        print 'm=%-6d W: %7.1fMB  dense diagonals: %7.2fs %8.1fMB peak  operator: %7.2fs %8.1fMB peak  max eigval diff: %.2e' % (m, 8.0*m*m/2**20, dense_time, dense_rss, operator_time, operator_rss, np.max(np.abs(dense_eigvals - operator_eigvals)))
+
+def bench_kernels(npts=(250, 500, 1000)):
+    """Times the construction of the kernel matrix for each kernel in dmaps_kernels, evaluated one pair at a time through '__call__' and in blocks through 'pairwise'
+
+    Args:
+        npts (list): dataset sizes to benchmark
+    """
+    import dmaps_kernels
+    swissroll = gen_swissroll()
+    # Data_Kernel points hold (parameters, model predictions at those parameters)
+    model_data = [(x[:2], np.array([np.sin(x[0]), np.cos(x[1]), x[2]])) for x in swissroll]
+    kernels = [('objective_function_kernel', dmaps_kernels.objective_function_kernel(50.0), swissroll),
+               ('gradient_kernel', dmaps_kernels.gradient_kernel(50.0, lambda x: 2*x), swissroll),
+               ('Data_Kernel', dmaps_kernels.Data_Kernel(5.0, 1.0), model_data)]
+    for name, kernel, data in kernels:
+        # hide 'pairwise' so that W is built pair by pair
+        pairwise_kernel = lambda x1, x2: kernel(x1, x2)
+        for m in npts:
+            start = time.time()
+            W_pairwise = dmaps._custom_kernel_matrix(data[:m], pairwise_kernel)
+            pairwise_time = time.time() - start
+            start = time.time()
+            W_batched = dmaps._custom_kernel_matrix(data[:m], kernel)
+            batched_time = time.time() - start
+            print '%-26s m=%-6d pairwise: %8.3fs  batched: %8.4fs  speedup: %8.1fx  max abs diff: %.2e' % (name, m, pairwise_time, batched_time, pairwise_time/batched_time, np.max(np.abs(W_pairwise - W_batched)))
+
+def bench_incremental(m=3000, batch_sizes=(10, 100, 500), epsilon=2.0, k=6):
+    """Compares appending a batch of points to an incremental 'dmaps.DMAPS_Model' against refitting the model on all points from scratch
+
+    Args:
+        m (int): number of points in the initial model
+        batch_sizes (list): numbers of points appended in each update
+        epsilon (float): the DMAPS kernel parameter
+        k (int): number of eigenpairs to compute
+    """
+    swissroll = gen_swissroll()
+    for batch_size in batch_sizes:
+        model = dmaps.DMAPS_Model(swissroll[:m], k, epsilon=epsilon, incremental=True)
+        start = time.time()
+        model.add_points(swissroll[m:m+batch_size])
+        update_time = time.time() - start
+        start = time.time()
+        refit = dmaps.DMAPS_Model(swissroll[:m+batch_size], k, epsilon=epsilon)
+        refit_time = time.time() - start
+        print 'm=%-6d batch=%-5d incremental: %7.2fs  refit: %7.2fs  speedup: %5.1fx  max eigval diff: %.2e' % (m, batch_size, update_time, refit_time, refit_time/update_time, np.max(np.abs(model.eigvals - refit.eigvals)))
+
+def bench_solvers(npts=(1000, 2000, 4000), ks=(4, 10), epsilon=5.0):
+    """Compares the eigensolvers of 'dmaps_solvers' on the normalized kernel matrix of swissroll data, reporting the time, iterations, products with the kernel matrix and largest residual of each, followed by the effect of warm-starting each solver from the eigenvectors at a nearby epsilon
+
+    Args:
+        npts (list): dataset sizes to benchmark
+        ks (list): numbers of eigenpairs to compute
+        epsilon (float): the DMAPS kernel parameter
+    """
+    swissroll = gen_swissroll()
+    solvers = ('arpack', 'lobpcg', 'randomized')
+    for m in npts:
+        W, _ = dmaps._kernel_matrix(swissroll[:m], epsilon=epsilon)
+        for k in ks:
+            for solver in solvers:
+                info = {}
+                start = time.time()
+                dmaps._compute_embedding(W, k, solver=solver, solver_info=info)
+                print 'm=%-6d k=%-3d %-10s %7.2fs  iterations: %5d  matvecs: %6d  max residual: %.1e' % (m, k, solver, time.time() - start, info['iterations'], info['matvecs'], np.max(info['residuals']))
+    m, k = npts[-1], ks[0]
+    W_previous, _ = dmaps._kernel_matrix(swissroll[:m], epsilon=1.05*epsilon)
+    W, _ = dmaps._kernel_matrix(swissroll[:m], epsilon=epsilon)
+    for solver in solvers:
+        v0 = dmaps._compute_embedding(W_previous, k, solver=solver)[1]
+        cold, warm = {}, {}
+        dmaps._compute_embedding(W, k, solver=solver, solver_info=cold)
+        dmaps._compute_embedding(W, k, v0=v0, solver=solver, solver_info=warm)
+        print 'm=%-6d k=%-3d %-10s matvecs cold: %6d  warm-started: %6d' % (m, k, solver, cold['matvecs'], warm['matvecs'])
+
+def bench_landmarks(n_landmarks=(100, 250, 500, 1000), methods=('random', 'kmeans', 'farthest'), epsilon=2.0, k=6, large_npts=(20000, 100000)):
+    """Reports the accuracy of 'dmaps.embed_data_landmarks' against the exact embedding of the swissroll, as the error in each eigenvalue and the absolute cosine between each approximate and exact eigenvector, then times the sparse landmark embedding of larger datasets resampled from the swissroll
+
+    Args:
+        n_landmarks (list): numbers of landmarks to benchmark
+        methods (list): landmark selection methods to benchmark
+        epsilon (float): the DMAPS kernel parameter
+        k (int): number of eigenpairs to compute
+        large_npts (list): sizes of the resampled datasets to time
+    """
+    swissroll = gen_swissroll()
+    start = time.time()
+    exact_eigvals, exact_eigvects = dmaps.embed_data(swissroll, k, epsilon=epsilon)
+    print 'm=%-6d exact: %7.2fs' % (swissroll.shape[0], time.time() - start)
+    for method in methods:
+        for L in n_landmarks:
+            start = time.time()
+            eigvals, eigvects = dmaps.embed_data_landmarks(swissroll, k, L, epsilon=epsilon, landmark_method=method, seed=0)
+            elapsed = time.time() - start
+            cosines = np.abs(np.sum(exact_eigvects*eigvects, 0))
+            print '%-8s L=%-5d %7.2fs  eigval errors: %s  eigvect cosines: %s' % (method, L, elapsed, ' '.join('%.1e' % e for e in np.abs(eigvals - exact_eigvals)[1:]), ' '.join('%.3f' % c for c in cosines[1:]))
+    random_state = np.random.RandomState(0)
+    for m in large_npts:
+        data = swissroll[random_state.randint(swissroll.shape[0], size=m)] + random_state.normal(scale=0.1, size=(m, swissroll.shape[1]))
+        start = time.time()
+        dmaps.embed_data_landmarks(data, k, n_landmarks[-1], epsilon=epsilon, landmark_method='farthest', n_neighbors=50, seed=0)
+        print 'm=%-7d L=%-5d farthest, 50 nearest landmarks: %7.2fs' % (m, n_landmarks[-1], time.time() - start)
+
+def _precision_run(m, k, epsilon, dtype):
+    """Embeds the first 'm' swissroll points with W stored as 'dtype', returning the eigenpairs"""
+    return dmaps.embed_data(gen_swissroll()[:m], k, epsilon=epsilon, dtype=dtype)
+
+def bench_precision(npts=(1000, 2000, 4000), k=6, epsilon=2.0):
+    """Compares time and peak memory of 'dmaps.embed_data' with W in double and in single precision, along with the agreement of the two embeddings as the largest eigenvalue difference and the smallest absolute cosine between corresponding eigenvectors
+
+    Args:
+        npts (list): dataset sizes to benchmark
+        k (int): number of eigenpairs to compute
+        epsilon (float): the DMAPS kernel parameter
+    """
+    for m in npts:
+        double_time, double_rss, (double_eigvals, double_eigvects) = _measure(_precision_run, m, k, epsilon, np.float64)
+        single_time, single_rss, (single_eigvals, single_eigvects) = _measure(_precision_run, m, k, epsilon, np.float32)
+        print 'm=%-6d float64: %7.2fs %8.1fMB peak  float32: %7.2fs %8.1fMB peak  max eigval diff: %.2e  min eigvect cosine: %.10f' % (m, double_time, double_rss, single_time, single_rss, np.max(np.abs(double_eigvals - single_eigvals)), np.min(np.abs(np.sum(double_eigvects*single_eigvects, 0))))
+
+def bench_native(npts=(250, 500, 1000, 2000), k=6, epsilon='mean'):
+    """Compares 'dmaps.embed_data' with the numpy and the native C++ backend, timing both and reporting their agreement as the largest eigenvalue difference and the smallest absolute cosine between corresponding eigenvectors. Skipped if the shared library has not been built.
+
+    Args:
+        npts (list): dataset sizes to benchmark
+        k (int): number of eigenpairs to compute
+        epsilon (string, float): the DMAPS kernel parameter, see 'dmaps.embed_data'
+    """
+    if not dmaps_native.available():
+        print 'native backend not built (make libdmaps.so), skipping'
+        return
+    data = gen_swissroll()
+    for m in npts:
+        start = time.time()
+        numpy_eigvals, numpy_eigvects = dmaps.embed_data(data[:m], k, epsilon=epsilon)
+        numpy_time = time.time() - start
+        start = time.time()
+        native_eigvals, native_eigvects = dmaps.embed_data(data[:m], k, epsilon=epsilon, backend='native')
+        native_time = time.time() - start
+        print 'm=%-6d numpy: %7.3fs  native: %7.3fs  max eigval diff: %.2e  min eigvect cosine: %.10f' % (m, numpy_time, native_time, np.max(np.abs(numpy_eigvals - native_eigvals)), np.min(np.abs(np.sum(numpy_eigvects*native_eigvects, 0))))
+
+def bench_batch(njobs=32, m=500, k=6, workers=None):
+    """Times a scan over epsilon of 'njobs' embeddings of swissroll data run one after another and by 'dmaps_batch.run_jobs', checking that both give the same eigenvalues
+
+    Args:
+        njobs (int): the number of embeddings
+        m (int): the number of points in each embedding
+        k (int): number of eigenpairs to compute
+        workers (int): the number of worker processes, see 'dmaps_batch.run_jobs'
+    """
+    data = gen_swissroll()[:m]
+    jobs = [{'id': epsilon, 'data': data, 'k': k, 'epsilon': epsilon} for epsilon in np.linspace(2.0, 6.0, njobs)]
+    start = time.time()
+    serial_eigvals = [dmaps.embed_data(data, k, epsilon=job['epsilon'])[0] for job in jobs]
+    serial_time = time.time() - start
+    start = time.time()
+    batch_eigvals = [None]*njobs
+    for result in dmaps_batch.run_jobs(jobs, workers):
+        batch_eigvals[result['index']] = result['eigvals']
+    batch_time = time.time() - start
+    print '%d jobs of m=%d  serial: %7.2fs (%5.1f jobs/s)  batch: %7.2fs (%5.1f jobs/s)  max eigval diff: %.2e' % (njobs, m, serial_time, njobs/serial_time, batch_time, njobs/batch_time, np.max(np.abs(np.array(serial_eigvals) - np.array(batch_eigvals))))
+
+def bench_plotting(npts=(10**4, 10**5, 10**6), k=6, methods=('decimate', 'density'), filename='/tmp/bench_dmaps_grid.png'):
+    """Times 'plot_dmaps.plot_embeddings_grid' on random embeddings of increasing size, reporting the size of the saved figure, both of which should stay roughly constant
+
+    Args:
+        npts (list): numbers of points to plot
+        k (int): number of eigenvectors, giving "k-1 choose 2" panels
+        methods (list): methods of 'plot_embeddings_grid' to benchmark
+        filename (str): file the figures are saved to
+    """
+    import os
+    import plot_dmaps
+    random_state = np.random.RandomState(0)
+    eigvals = np.linspace(1, 0.5, k)
+    for m in npts:
+        eigvects = random_state.normal(size=(m, k))
+        for method in methods:
+            start = time.time()
+            plot_dmaps.plot_embeddings_grid(eigvects, eigvals, filename=filename, color=eigvects[:,1], method=method)
+            print 'm=%-8d %-9s %7.2fs %8.1fkB' % (m, method, time.time() - start, os.path.getsize(filename)/1024.0)
+
+if __name__=="__main__":
+    bench_distances()
+    bench_normalization()
+    bench_kernels()
+    bench_incremental()
+    bench_solvers()
+    bench_landmarks()
+    bench_precision()
+    bench_native()
+    bench_batch()
+    bench_plotting()
@@ -0,0 +1,155 @@
+"""A benchmark suite sweeping the number of points, their dimension, the number of eigenpairs and the type of kernel on synthetic data, recording the cost of each stage of the embedding with 'dmaps_profile.Stats'. Results are written as JSON so that runs can be compared to catch performance regressions.
+
+Run as a script, e.g.
+
+    python bench_suite.py --npts 1000 2000 --dims 3 10 --ks 4 --output results.json
+    python bench_suite.py --npts 1000 2000 --dims 3 10 --ks 4 --compare results.json --tolerance 1.2
+
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+import dmaps
+import dmaps_kernels
+import dmaps_profile
+
+# the kernels benchmarked, in the order they are run
+kernels = ('gaussian', 'sparse', 'objective_function', 'gradient')
+
+def synthetic_data(m, dim, seed=0):
+    """Samples 'm' points from a swissroll whose first three coordinates are the usual roll and whose remaining 'dim' - 3 coordinates are small gaussian noise
+
+    Args:
+        m (int): the number of points
+        dim (int): the dimension of each point, at least three
+        seed (int): seed for the random number generator
+
+    Returns:
+        data (array): shape (m, dim) array of points
+    """
+    random_state = np.random.RandomState(seed)
+    t = 1.5*np.pi*(1 + 2*random_state.uniform(size=m))
+    data = np.empty((m, dim))
+    data[:,0] = t*np.cos(t)
+    data[:,1] = t*np.sin(t)
+    data[:,2] = 20*random_state.uniform(size=m)
+    data[:,3:] = random_state.normal(scale=0.1, size=(m, dim - 3))
+    return data
+
+def _quadratic_gradient(x):
+    """The gradient of :math:`f(x) = 0.01 \|x\|^2`, used by the "gradient" kernel"""
+    return 0.02*x
+
+def run_case(m, dim, k, kernel, n_neighbors=50, seed=0):
+    """Embeds synthetic data with one kernel, recording the cost of each stage
+
+    Args:
+        m (int): the number of points
+        dim (int): the dimension of each point
+        k (int): the number of eigenpairs
+        kernel (string): one of 'kernels': "gaussian" uses 'dmaps.embed_data', "sparse" the same with 'n_neighbors', and "objective_function" and "gradient" the corresponding kernels of 'dmaps_kernels' through 'dmaps.embed_data_customkernel'
+        n_neighbors (int): the number of neighbors of the "sparse" kernel
+        seed (int): seed for the synthetic data
+
+    Returns:
+        result (dict): the parameters of the case, the recorded 'stages', the 'total' wall and cpu times, and the eigensolver's iterations, products and largest residual
+    """
+    data = synthetic_data(m, dim, seed)
+    stats = dmaps_profile.Stats()
+    if kernel == 'gaussian':
+        dmaps.embed_data(data, k, epsilon='median', stats=stats)
+    elif kernel == 'sparse':
+        dmaps.embed_data(data, k, epsilon='median', n_neighbors=min(n_neighbors, m), stats=stats)
+    else:
+        # these kernels divide squared distances by epsilon
+        epsilon = dmaps.epsilon_statistics(data, nsamples=min(10**5, m*(m-1)/2), seed=seed)[3]**2
+        if kernel == 'objective_function':
+            # the last coordinate holds the objective function value
+            data[:,-1] = 0.01*np.sum(data[:,:-1]**2, 1)
+            custom_kernel = dmaps_kernels.objective_function_kernel(epsilon)
+        elif kernel == 'gradient':
+            custom_kernel = dmaps_kernels.gradient_kernel(epsilon, _quadratic_gradient)
+        else:
+            raise ValueError('unknown kernel ' + repr(kernel))
+        # <grad f(x_i), x_i - x_j> differs from <grad f(x_j), x_j - x_i>, so the gradient kernel needs the full W and the non-symmetric eigensolver
+        dmaps.embed_data_customkernel(data, k, custom_kernel, symmetric=(kernel != 'gradient'), stats=stats)
+    solver_info = stats.info['solver']
+    return {'m': m, 'dim': dim, 'k': k, 'kernel': kernel,
+            'stages': stats.stages,
+            'total': {'wall': stats.total('wall'), 'cpu': stats.total('cpu')},
+            'solver': {'name': solver_info['solver'], 'iterations': solver_info['iterations'], 'matvecs': solver_info['matvecs'], 'max_residual': float(np.max(solver_info['residuals'])), 'converged': solver_info['converged']}}
+
+def run_suite(npts=(1000, 2000, 4000), dims=(3, 10, 50), ks=(4, 10), kernels=kernels, repeats=1):
+    """Runs 'run_case' over every combination of the given parameters, printing a summary line per case
+
+    Args:
+        npts (list): numbers of points
+        dims (list): dimensions of the points
+        ks (list): numbers of eigenpairs
+        kernels (list): kernels, see 'run_case'
+        repeats (int): the number of times each case is run, of which the fastest (by total wall time) is kept to reduce noise
+
+    Returns:
+        results (list): one dictionary per case, see 'run_case'
+    """
+    results = []
+    for kernel in kernels:
+        for m in npts:
+            for dim in dims:
+                for k in ks:
+                    result = min((run_case(m, dim, k, kernel) for i in xrange(repeats)), key=lambda result: result['total']['wall'])
+                    print '%-18s m=%-6d dim=%-4d k=%-3d %8.3fs wall %8.3fs cpu  %s' % (kernel, m, dim, k, result['total']['wall'], result['total']['cpu'], '  '.join('%s %.3fs' % (stage['name'], stage['wall']) for stage in result['stages']))
+                    sys.stdout.flush()
+                    results.append(result)
+    return results
+
+def compare(results, baseline, tolerance=1.25):
+    """Finds the cases of 'results' whose total wall time exceeds that of the same case in 'baseline' by more than the factor 'tolerance'
+
+    Args:
+        results (list): cases from 'run_suite'
+        baseline (list): cases from an earlier 'run_suite'. Cases missing from either are ignored.
+        tolerance (float): the allowed ratio of new to baseline time
+
+    Returns:
+        regressions (list): (result, baseline_result) pairs of the slower cases
+    """
+    def case(result):
+        return (result['m'], result['dim'], result['k'], result['kernel'])
+    baseline = dict((case(result), result) for result in baseline)
+    regressions = []
+    for result in results:
+        previous = baseline.get(case(result))
+        if previous is not None and result['total']['wall'] > tolerance*previous['total']['wall']:
+            regressions.append((result, previous))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the stages of DMAPS embeddings on synthetic data')
+    parser.add_argument('--npts', type=int, nargs='+', default=[1000, 2000, 4000])
+    parser.add_argument('--dims', type=int, nargs='+', default=[3, 10, 50])
+    parser.add_argument('--ks', type=int, nargs='+', default=[4, 10])
+    parser.add_argument('--kernels', nargs='+', choices=kernels, default=list(kernels))
+    parser.add_argument('--repeats', type=int, default=1, help='runs of each case, of which the fastest is kept')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run to check for regressions against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='allowed ratio of new to baseline wall time')
+    args = parser.parse_args(argv)
+    results = run_suite(args.npts, args.dims, args.ks, args.kernels, args.repeats)
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump({'created': time.time(), 'platform': platform.platform(), 'python': platform.python_version(), 'numpy': np.__version__, 'results': results}, output, indent=1)
+    if args.compare is not None:
+        with open(args.compare) as baseline:
+            regressions = compare(results, json.load(baseline)['results'], args.tolerance)
+        for result, previous in regressions:
+            print 'regression: %-18s m=%-6d dim=%-4d k=%-3d %8.3fs, was %8.3fs' % (result['kernel'], result['m'], result['dim'], result['k'], result['total']['wall'], previous['total']['wall'])
+        return 1 if regressions else 0
+    return 0
+
+if __name__=="__main__":
+    sys.exit(main())
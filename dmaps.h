@@ -7,6 +7,7 @@
 
 typedef Eigen::MatrixXd Matrix;
 typedef Eigen::VectorXd Vector;
+typedef Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor> Row_Matrix;
 
 class Kernel_Function;
 
@@ -61,6 +62,20 @@ namespace dmaps {
    */
   template <typename T>
     int map(const std::vector<T>& input_data, const Kernel_Function& kernel_fn, Vector& eigvals, Matrix& eigvects, Matrix& W, const int k=5, const double weight_threshold = 0);
+  /**
+   * Performs DMAP on the rows of the matrix 'input_data' using kernel 'kernel_fn', calculating a 'k'-dimensional embedding. <b> This method neither copies its input nor allocates its output: </b> 'input_data' may be an Eigen::Map of memory owned by the caller (e.g. a NumPy array), and the eigenpairs are written directly into 'eigvals' and 'eigvects', which may likewise be Eigen::Map views.
+   *
+   * \tparam Derived Eigen expression type of the data, e.g. Eigen::Map<const Row_Matrix>
+   * \param input_data matrix in which each row is a data point
+   * \param kernel_fn kernel function used to evaluate each entry of 'W': \f$W_{ij} = k(x_i, x_j)\f$, accepting rows of 'input_data'
+   * \param eigvals vector of size 'k' used to store DMAP's output eigenvalues
+   * \param eigvects matrix of size (n, k) used to store DMAP's output eigenvectors, <b> one eigenvector per column </b>
+   * \param k dimension of embedding to compute, i.e. the number of eigval/eigvect pairs to find
+   * \param weight_threshold threshold for elements of W, i.e. \f$W_{ij} < \f$ 'weight_threshold', set \f$W_{ij} = 0\f$
+   * \returns indicator of success: 0 -> success, 1 -> failure
+   */
+  template <typename Derived>
+    int map(const Eigen::MatrixBase<Derived>& input_data, const Kernel_Function& kernel_fn, Eigen::Ref<Vector> eigvals, Eigen::Ref<Matrix> eigvects, const int k=5, const double weight_threshold = 0);
   /**
    * Investigates suitability of different DMAP kernels for use on 'input_data' by calculating \f$\sum_i \sum_j W_{ij}\f$ for each kernel. A kernel should be chosen from the region in which a plot of the output sum vs. kernel parameter is linear.
    *
@@ -71,6 +86,16 @@ namespace dmaps {
    */
   template <typename T>
     std::vector<double> test_kernels(const std::vector<T>& input_data, const std::vector<Kernel_Function>& kernel_fns);
+  /**
+   * Investigates suitability of different DMAP kernels for use on the rows of the matrix 'input_data', as 'test_kernels' above, without copying the data
+   *
+   * \tparam Derived Eigen expression type of the data, e.g. Eigen::Map<const Row_Matrix>
+   * \param input_data matrix in which each row is a data point
+   * \param kernel_fns vector of kernel functions, each of which will be used to calculate a single value \f$\sum_i \sum_j k(x_i, x_j)\f$
+   * \returns vector of \f$\sum_i \sum_j k(x_i, x_j)\f$ values for each input kernel
+   */
+  template <typename Derived>
+    std::vector<double> test_kernels(const Eigen::MatrixBase<Derived>& input_data, const std::vector<Kernel_Function>& kernel_fns);
 }
 
 #include "dmaps.tpp"
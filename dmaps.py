@@ -4,89 +4,492 @@
 
 """
 
+import multiprocessing
+import tempfile
 import numpy as np
+import scipy.sparse as sparse
 import scipy.sparse.linalg as spla
-from scipy.spatial.distance import pdist
+from scipy.spatial import cKDTree, distance
+from scipy.spatial.distance import pdist, cdist, squareform
+import dmaps_cache
+import dmaps_native
+import dmaps_profile
+import dmaps_solvers
 
 def _l2_distance(vector1, vector2):
     """Returns the l2 norm of vector1 - vector2: :math:`\sqrt{\sum_i (x_i - y_i)^2}`"""
     return np.linalg.norm(vector1 - vector2)
 
 
-def _compute_embedding_laplace_beltrami(W, k, symmetric=True):
-    """Calculates a partial ('k'-dimensional) eigendecomposition of W by first transforming into a self-adjoint matrix and then using the Lanczos algorithm. **Unlike '_compute_embedding', this method normalizes W by an estimate of the local probability density at each point in order to remove the influence of nonuniform sampling from the embedding.** In this way, the eigenvalues and eigenvectors should actually approximate the eigenvalues and eigenvectors of the heat operator on the manifold.
+def _is_point_array(data):
+    """Returns whether 'data' is a shape ("number of data points", "dimension of data") array of row vectors, the layout that allows distances to be computed in vectorized form"""
+    return isinstance(data, np.ndarray) and data.ndim == 2
+
+
+def _euclidean_distances(X, Y):
+    """Computes the euclidean distances between the rows of 'X' and 'Y' through a single matrix product, using :math:`\|x - y\|^2 = \|x\|^2 + \|y\|^2 - 2 x \cdot y`
+
+    Args:
+        X (array): shape (n, p) array of row vectors
+        Y (array): shape (l, p) array of row vectors
+
+    Returns:
+        D (array): shape (n, l) array in which D[i,j] is the l2 distance between X[i] and Y[j]
+    """
+    # integer points cannot be written to in place, and the expansion cancels badly in single precision
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    D = np.dot(X, Y.T)
+    D *= -2
+    D += np.sum(X*X, 1)[:, np.newaxis]
+    D += np.sum(Y*Y, 1)
+    # roundoff may leave slightly negative squared distances between (nearly) coincident points
+    np.maximum(D, 0, out=D)
+    return np.sqrt(D, out=D)
+
+
+def _cdist(X, Y, metric=_l2_distance):
+    """Computes the distances between every point in 'X' and every point in 'Y'. Arrays of row vectors are handled in vectorized form when 'metric' is either the default '_l2_distance' or the name of any metric understood by scipy.spatial.distance.cdist (e.g. "cityblock", "cosine", "minkowski"). Any other 'metric' is evaluated one pair at a time.
 
     Args:
-        W (array): symmetric, shape (npts, npts) array in which W[i,j] is the DMAPS kernel evaluation for points i and j
+        X (iterable): the first set of points, either an array of row vectors or a list of points
+        Y (iterable): the second set of points, either an array of row vectors or a list of points
+        metric (function, string): the distance measure, accepting calls like metric(X[i], Y[j]), or a scipy metric name
+
+    Returns:
+        D (array): shape (len(X), len(Y)) array in which D[i,j] is the distance between X[i] and Y[j]
+    """
+    if metric is _l2_distance and _is_point_array(X) and _is_point_array(Y):
+        return _euclidean_distances(X, Y)
+    if isinstance(metric, str):
+        return cdist(np.asarray(X), np.asarray(Y), metric)
+    D = np.empty((len(X), len(Y)))
+    for i in xrange(len(X)):
+        for j in xrange(len(Y)):
+            D[i,j] = metric(X[i], Y[j])
+    return D
+
+
+def _paired_distances(X, Y, metric=_l2_distance):
+    """Computes the distance between each point in 'X' and the point at the same position in 'Y', vectorized for the default l2 distance
+
+    Args:
+        X (array): shape (n, p) array of row vectors
+        Y (array): shape (n, p) array of row vectors
+        metric (function, string): the distance measure, accepting calls like metric(X[i], Y[i]), or a scipy metric name
+
+    Returns:
+        d (array): shape (n) vector in which d[i] is the distance between X[i] and Y[i]
+    """
+    if metric is _l2_distance or metric == 'euclidean':
+        return np.sqrt(np.sum(np.power(X - Y, 2), 1))
+    if isinstance(metric, str):
+        metric = getattr(distance, metric)
+    return np.array([metric(x, y) for x, y in zip(X, Y)])
+
+
+# the number of entries computed at once in double precision when distances are stored in a narrower dtype and no block size is given
+_conversion_block_entries = 2**22
+
+def _pairwise_distances(data, metric=_l2_distance, block_size=None, dtype=np.float64):
+    """Computes the full, symmetric matrix of distances between all points in 'data'. Vectorizable inputs (see '_cdist') are processed 'block_size' rows at a time so that no intermediate larger than (block_size, "number of data points") is allocated, while arbitrary Python metrics fall back to evaluating each of the "m choose 2" pairs individually.
+
+    Args:
+        data (iterable): typically a shape ("number of data points", "dimension of data") array containing the data as row vectors, but could be a list in which the :math:`i^{th}` entry contains :math:`i^{th}` data point
+        metric (function, string): the distance measure, accepting calls like metric(data[i], data[j]), or a scipy metric name
+        block_size (int): the number of rows computed at once in the vectorized case. If None, all rows are computed together, unless 'dtype' is narrower than float64, in which case rows are computed in blocks of about '_conversion_block_entries' entries.
+        dtype (type): the type of the returned array. Vectorized distances are computed in double precision, even from single precision 'data', and rounded when stored, so a single precision 'D' takes half the memory without the roundoff of computing :math:`\|x\|^2 + \|y\|^2 - 2 x \cdot y` in single precision. Python metrics are evaluated in whatever precision they use.
+
+    Returns:
+        D (array): shape ("number of data points", "number of data points") array in which D[i,j] is the distance between points i and j
+    """
+    m = len(data)
+    vectorizable = isinstance(metric, str) or (metric is _l2_distance and _is_point_array(data))
+    if not vectorizable:
+        D = np.empty([m, m], dtype=dtype)
+        for i in xrange(m):
+            D[i,i] = 0
+            for j in xrange(i+1, m):
+                D[i,j] = metric(data[i], data[j])
+                D[j,i] = D[i,j]
+        return D
+    if block_size is None and np.dtype(dtype) != np.float64:
+        block_size = max(1, _conversion_block_entries/m)
+    if block_size is None and isinstance(metric, str):
+        # pdist only evaluates the upper triangle
+        return squareform(pdist(np.asarray(data), metric))
+    if block_size is None:
+        # a single block needs no separate output array
+        D = _cdist(data, data, metric)
+        np.fill_diagonal(D, 0)
+        return D
+    D = np.empty([m, m], dtype=dtype)
+    for start in xrange(0, m, block_size):
+        stop = min(start + block_size, m)
+        D[start:stop] = _cdist(data[start:stop], data, metric)
+    # self-distances are zero by definition, discard roundoff
+    np.fill_diagonal(D, 0)
+    return D
+
+
+def _minkowski_p(metric):
+    """Returns the order 'p' of the Minkowski norm equivalent to 'metric', as used by the KD-tree in neighbor searches. Only the l1, l2 and :math:`l_{\infty}` distances are supported."""
+    if metric is _l2_distance or metric == 'euclidean':
+        return 2
+    elif metric == 'cityblock':
+        return 1
+    elif metric == 'chebyshev':
+        return np.inf
+    raise ValueError('neighbor searches only support the default l2 distance, "euclidean", "cityblock" and "chebyshev" metrics')
+
+
+def _neighbor_distances(data, metric=_l2_distance, n_neighbors=None, cutoff=None, query=None, tree=None):
+    """Computes a sparse matrix containing only the distances between neighboring points, found with a KD-tree. Neighbors are either each point's 'n_neighbors' nearest points, all points within distance 'cutoff', or, if both are given, the nearest 'n_neighbors' points that also lie within 'cutoff'.
+
+    .. note::
+        Every point is its own nearest neighbor, so when 'query' is 'data' the diagonal is always stored (as an explicit zero). The k-nearest-neighbor relation is not symmetric, and neither is the returned matrix in that case.
+
+    Args:
+        data (array): shape ("number of data points", "dimension of data") array containing the data as row vectors
+        metric (function, string): the distance measure, see '_minkowski_p' for supported values
+        n_neighbors (int): the number of nearest neighbors, including the point itself, to keep in each row
+        cutoff (float): the maximum distance between neighbors
+        query (array): shape ("number of query points", "dimension of data") array of the points whose neighbors in 'data' are found. If None, 'data' itself is used.
+        tree (cKDTree): a previously constructed KD-tree of 'data', which is otherwise built here
+
+    Returns:
+        D (sparse matrix): shape ("number of query points", "number of data points") CSR matrix in which D[i,j] is the distance between query point i and data point j if j is a neighbor of i
+    """
+    p = _minkowski_p(metric)
+    if tree is None:
+        tree = cKDTree(data)
+    if query is None:
+        query, query_tree = data, tree
+    else:
+        query_tree = None
+    shape = (query.shape[0], data.shape[0])
+    if n_neighbors is None:
+        if query_tree is None:
+            query_tree = cKDTree(query)
+        # the coo output keeps zero distances, including the diagonal, as explicit entries
+        return query_tree.sparse_distance_matrix(tree, cutoff, p=p, output_type='coo_matrix').tocsr()
+    upper_bound = np.inf if cutoff is None else cutoff
+    dists, indices = tree.query(query, k=n_neighbors, p=p, distance_upper_bound=upper_bound)
+    dists = dists.reshape(shape[0], -1)
+    indices = indices.reshape(shape[0], -1)
+    # missing neighbors beyond 'cutoff' are reported with infinite distance
+    found = np.isfinite(dists)
+    indptr = np.concatenate(([0], np.cumsum(np.sum(found, 1))))
+    return sparse.csr_matrix((dists[found], indices[found], indptr), shape=shape)
+
+
+def _row_sums(W):
+    """Returns the sums of the rows of the dense or sparse matrix, or LinearOperator, 'W' as a flat array. Sums are accumulated in double precision whatever the type of 'W'."""
+    if isinstance(W, spla.LinearOperator):
+        return W.matvec(np.ones(W.shape[1])).astype(np.float64)
+    return np.asarray(W.sum(1, dtype=np.float64)).ravel()
+
+
+def _dot(W, x):
+    """Returns the product of the dense or sparse matrix, or LinearOperator, 'W' with the vector or block of vectors 'x', first rounding 'x' to the type of 'W' so that a single precision 'W' is never promoted to a double precision copy. The real and imaginary parts of a complex 'x', e.g. eigenvectors from the non-symmetric eigensolver, are multiplied separately for the same reason."""
+    if np.iscomplexobj(x) and not np.iscomplexobj(W):
+        return _dot(W, x.real) + 1j*_dot(W, x.imag)
+    return W.dot(x.astype(W.dtype, copy=False))
+
+
+def _blocked_operator(W, block_size):
+    """Returns a LinearOperator that multiplies by the dense array 'W' 'block_size' rows at a time. When 'W' is a memory-mapped array, each product then only needs one row block of 'W' in memory at once, and a product with a block of vectors reads 'W' only once for all of them.
+
+    Args:
+        W (array): shape (npts, npts) array, typically a numpy.memmap
+        block_size (int): the number of rows multiplied at once
+
+    Returns:
+        W_operator (LinearOperator): shape (npts, npts) operator equivalent to 'W'
+    """
+    m = W.shape[0]
+    def matvec(x):
+        x = np.ravel(x)
+        y = np.empty(m)
+        for start in xrange(0, m, block_size):
+            y[start:start+block_size] = W[start:start+block_size].dot(x)
+        return y
+    def matmat(X):
+        Y = np.empty((m, X.shape[1]))
+        for start in xrange(0, m, block_size):
+            Y[start:start+block_size] = W[start:start+block_size].dot(X)
+        return Y
+    return spla.LinearOperator(W.shape, matvec=matvec, matmat=matmat, dtype=W.dtype)
+
+
+def _scaled_operator(W, scaling):
+    """Returns a LinearOperator representing :math:`S W S`, where :math:`S` is the diagonal matrix with entries 'scaling'. The diagonal scaling is applied to each vector as it is multiplied, so neither :math:`S` nor the product is ever formed and 'W' is left untouched.
+
+    Args:
+        W (array, sparse matrix): shape (npts, npts) dense array or scipy.sparse matrix
+        scaling (array): shape (npts) vector of diagonal entries
+
+    Returns:
+        S_W_S (LinearOperator): shape (npts, npts) operator suitable for use with the ARPACK routines in scipy.sparse.linalg
+    """
+    def matvec(x):
+        return scaling*_dot(W, scaling*np.ravel(x))
+    def matmat(X):
+        return scaling[:, np.newaxis]*_dot(W, scaling[:, np.newaxis]*X)
+    # the products with W are carried out in its own precision, the eigensolver's vectors in that of 'scaling'
+    return spla.LinearOperator(W.shape, matvec=matvec, matmat=matmat, dtype=np.result_type(W.dtype, scaling.dtype))
+
+
+def _scaled_eigendecomposition(W, k, scaling, D_half_inv, symmetric=True, v0=None, solver='arpack', solver_options=None, solver_info=None, stats=None):
+    """Calculates the partial eigendecomposition shared by '_compute_embedding' and '_compute_embedding_laplace_beltrami'. The 'k' leading eigenpairs of the self-adjoint operator :math:`S W S` are found with 'solver', by default the Lanczos (or, if not 'symmetric', Arnoldi) algorithm, after which the eigenvectors are transformed by :math:`D^{-1/2}`, sorted and normalized.
+
+    Args:
+        W (array, sparse matrix): shape (npts, npts) dense array or scipy.sparse matrix of kernel evaluations
         k (int): the number of eigenvectors and eigenvalues to compute
-        symmetric (bool): indicates whether the Markov matrix is symmetric or not. During standard useage with the default kernel, this will be true allowing for accelerated numerics. **However, if using custom_kernel(), this property may not hold.**
+        scaling (array): shape (npts) diagonal of :math:`S`
+        D_half_inv (array): shape (npts) diagonal of :math:`D^{-1/2}`
+        symmetric (bool): whether :math:`S W S` is symmetric
+        v0 (array): shape (npts) starting vector, or shape (npts, j) block of starting vectors, approximating the returned eigenvectors. It is transformed by :math:`D^{1/2}` to approximate the eigenvectors of :math:`S W S`. If None, random vectors are used.
+        solver (string, function): one of the names in 'dmaps_solvers.solvers', i.e. "arpack", "lobpcg" or "randomized", or a function with the same signature as those in 'dmaps_solvers'. Only "arpack" supports non-symmetric problems.
+        solver_options (dict): additional keyword arguments for 'solver', e.g. 'tol' and 'maxiter'
+        solver_info (dict): if given, updated with the iteration count, number of products and residuals reported by 'solver'
+        stats (dmaps_profile.Stats): if given, records the cost of the "eigensolve" stage, and the report of 'solver' under stats.info['solver']
 
     Returns:
         eigvals (array): shape (k) vector with first 'k' eigenvectors of DMAPS embedding sorted from largest to smallest
         eigvects (array): shape ("number of data points", k) array with the k-dimensional DMAPS-embedding eigenvectors. eigvects[:,i] corresponds to the eigenvector of the :math:`i^{th}`-largest eigenvalue, eigval[i].
     """
-    m = W.shape[0]
-    # diagonal matrix D, inverse, sqrt
-    local_density_estimate_inv = np.identity(m)/np.sum(W,1)
-    W = np.dot(np.dot(local_density_estimate_inv, W), local_density_estimate_inv)
-    # transform into self-adjoint matrix and find partial eigendecomp of this transformed matrix
-    D_half_inv = np.identity(m)/np.sqrt(np.sum(W,1))
-    eigvals, eigvects = None, None
-    if symmetric:
-        eigvals, eigvects = spla.eigsh(np.dot(np.dot(D_half_inv, W), D_half_inv), k=k) # eigsh (eigs hermitian)
-    else:
-        eigvals, eigvects = spla.eigs(np.dot(np.dot(D_half_inv, W), D_half_inv), k=k) # eigs (plain eigs)
+    S_W_S = _scaled_operator(W, scaling)
+    if not callable(solver):
+        solver = dmaps_solvers.solvers[solver]
+    if v0 is not None:
+        # eigenvectors of S W S are those of W scaled by D^{1/2}
+        v0 = np.real(v0)/(D_half_inv if np.ndim(v0) == 1 else D_half_inv[:, np.newaxis])
+    with dmaps_profile.stage(stats, 'eigensolve'):
+        eigvals, eigvects, info = solver(S_W_S, k, symmetric, v0, **(solver_options or {}))
+        eigvals, eigvects = _normalized_eigenpairs(eigvals, eigvects, D_half_inv)
+    if solver_info is not None:
+        solver_info.update(info)
+    if stats is not None:
+        stats.info['solver'] = info
+    return eigvals, eigvects
+
+
+def _normalized_eigenpairs(eigvals, eigvects, D_half_inv):
+    """Transforms the eigenvectors of the self-adjoint :math:`S W S` by :math:`D^{-1/2}`, then sorts the eigenpairs from largest to smallest eigenvalue magnitude and scales the eigenvectors to norm one
+
+    Args:
+        eigvals (array): shape (k) vector of eigenvalues
+        eigvects (array): shape (npts, k) array of the corresponding eigenvectors of :math:`S W S`, modified in place
+        D_half_inv (array): shape (npts) diagonal of :math:`D^{-1/2}`
+
+    Returns:
+        eigvals (array): shape (k) vector of sorted eigenvalues
+        eigvects (array): shape (npts, k) array of the corresponding DMAPS eigenvectors
+    """
     # transform eigenvectors to match W
-    eigvects = np.dot(D_half_inv, eigvects)
+    eigvects *= D_half_inv[:, np.newaxis]
     # sort eigvals and corresponding eigvects from largest to smallest magnitude  (reverse order)
     sorted_indices = np.argsort(np.abs(eigvals))[::-1]
 
     eigvals = eigvals[sorted_indices]
     # also scale eigenvectors to norm one
-    eigvects = eigvects[:, sorted_indices]/np.linalg.norm(eigvects[:, sorted_indices], axis=0)
-    return eigvals, eigvects    
+    eigvects = eigvects[:, sorted_indices]
+    eigvects /= np.linalg.norm(eigvects, axis=0)
+    return eigvals, eigvects
+
+
+def _compute_embedding_laplace_beltrami(W, k, symmetric=True, v0=None, row_sums=None, solver='arpack', solver_options=None, solver_info=None, stats=None):
+    """Calculates a partial ('k'-dimensional) eigendecomposition of W by first transforming into a self-adjoint matrix and then using the Lanczos algorithm. **Unlike '_compute_embedding', this method normalizes W by an estimate of the local probability density at each point in order to remove the influence of nonuniform sampling from the embedding.** In this way, the eigenvalues and eigenvectors should actually approximate the eigenvalues and eigenvectors of the heat operator on the manifold.
+
+    Args:
+        W (array, sparse matrix): symmetric, shape (npts, npts) dense array or scipy.sparse matrix in which W[i,j] is the DMAPS kernel evaluation for points i and j
+        k (int): the number of eigenvectors and eigenvalues to compute
+        symmetric (bool): indicates whether the Markov matrix is symmetric or not. During standard useage with the default kernel, this will be true allowing for accelerated numerics. **However, if using custom_kernel(), this property may not hold.**
+        v0 (array): shape (npts) starting vector, or shape (npts, j) block of starting vectors, for the eigensolver, e.g. the eigenvectors of a closely related W, to warm-start the iteration. If None, random vectors are used.
+        row_sums (array): shape (npts) vector of the row sums of W, if already known. If None, they are computed from W.
+        solver (string, function): the eigensolver, see '_scaled_eigendecomposition'
+        solver_options (dict): additional keyword arguments for 'solver'
+        solver_info (dict): if given, updated with the iteration count, number of products and residuals reported by 'solver'
+        stats (dmaps_profile.Stats): if given, records the cost of the "normalization" and "eigensolve" stages
+
+    Returns:
+        eigvals (array): shape (k) vector with first 'k' eigenvectors of DMAPS embedding sorted from largest to smallest
+        eigvects (array): shape ("number of data points", k) array with the k-dimensional DMAPS-embedding eigenvectors. eigvects[:,i] corresponds to the eigenvector of the :math:`i^{th}`-largest eigenvalue, eigval[i].
+    """
+    with dmaps_profile.stage(stats, 'normalization'):
+        # diagonal of Q^{-1}, the inverse of the local density estimate
+        local_density_estimate_inv = 1/(_row_sums(W) if row_sums is None else row_sums)
+        # diagonal of D^{-1/2}, where D holds the row sums of Q^{-1} W Q^{-1}
+        D_half_inv = 1/np.sqrt(local_density_estimate_inv*_dot(W, local_density_estimate_inv))
+    # transform into self-adjoint matrix D^{-1/2} Q^{-1} W Q^{-1} D^{-1/2} and find partial eigendecomp of this transformed matrix
+    return _scaled_eigendecomposition(W, k, local_density_estimate_inv*D_half_inv, D_half_inv, symmetric, v0, solver, solver_options, solver_info, stats)
     
 
-def _compute_embedding(W, k, symmetric=True):
+def _compute_embedding(W, k, symmetric=True, v0=None, row_sums=None, solver='arpack', solver_options=None, solver_info=None, stats=None):
     """Calculates a partial ('k'-dimensional) eigendecomposition of W by first transforming into a self-adjoint matrix and then using the Lanczos algorithm.
 
     Args:
-        W (array): symmetric, shape (npts, npts) array in which W[i,j] is the DMAPS kernel evaluation for points i and j
+        W (array, sparse matrix): symmetric, shape (npts, npts) dense array or scipy.sparse matrix in which W[i,j] is the DMAPS kernel evaluation for points i and j
         k (int): the number of eigenvectors and eigenvalues to compute
         symmetric (bool): indicates whether the Markov matrix is symmetric or not. During standard useage with the default kernel, this will be true allowing for accelerated numerics. **However, if using custom_kernel(), this property may not hold.**
+        v0 (array): shape (npts) starting vector, or shape (npts, j) block of starting vectors, for the eigensolver, e.g. the eigenvectors of a closely related W, to warm-start the iteration. If None, random vectors are used.
+        row_sums (array): shape (npts) vector of the row sums of W, if already known. If None, they are computed from W.
+        solver (string, function): the eigensolver, see '_scaled_eigendecomposition'
+        solver_options (dict): additional keyword arguments for 'solver'
+        solver_info (dict): if given, updated with the iteration count, number of products and residuals reported by 'solver'
+        stats (dmaps_profile.Stats): if given, records the cost of the "normalization" and "eigensolve" stages
 
     Returns:
         eigvals (array): shape (k) vector with first 'k' eigenvectors of DMAPS embedding sorted from largest to smallest
         eigvects (array): shape ("number of data points", k) array with the k-dimensional DMAPS-embedding eigenvectors. eigvects[:,i] corresponds to the eigenvector of the :math:`i^{th}`-largest eigenvalue, eigval[i].
     """
-    m = W.shape[0]
-    # diagonal matrix D, inverse, sqrt
-    D_half_inv = np.identity(m)/np.sqrt(np.sum(W,1))
-    # transform into self-adjoint matrix and find partial eigendecomp of this transformed matrix
-    eigvals, eigvects = None, None
-    if symmetric:
-        eigvals, eigvects = spla.eigsh(np.dot(np.dot(D_half_inv, W), D_half_inv), k=k) # eigsh (eigs hermitian)
-    else:
-        eigvals, eigvects = spla.eigs(np.dot(np.dot(D_half_inv, W), D_half_inv), k=k) # eigs (plain eigs)
-    # transform eigenvectors to match W
-    eigvects = np.dot(D_half_inv, eigvects)
-    # sort eigvals and corresponding eigvects from largest to smallest magnitude  (reverse order)
-    sorted_indices = np.argsort(np.abs(eigvals))[::-1]
+    with dmaps_profile.stage(stats, 'normalization'):
+        # diagonal of D^{-1/2}
+        D_half_inv = 1/np.sqrt(_row_sums(W) if row_sums is None else row_sums)
+    # transform into self-adjoint matrix D^{-1/2} W D^{-1/2} and find partial eigendecomp of this transformed matrix
+    return _scaled_eigendecomposition(W, k, D_half_inv, D_half_inv, symmetric, v0, solver, solver_options, solver_info, stats)
 
-    eigvals = eigvals[sorted_indices]
-    # also scale eigenvectors to norm one
-    eigvects = eigvects[:, sorted_indices]/np.linalg.norm(eigvects[:, sorted_indices], axis=0)
+
+def _sparse_kernel(D, epsilon, symmetrize=False):
+    """Evaluates the DMAPS kernel on the stored entries of the sparse distance matrix 'D', leaving 'D' untouched
+
+    Args:
+        D (sparse matrix): CSR matrix of neighbor distances, see '_neighbor_distances'
+        epsilon (float): the DMAPS parameter :math:`\epsilon`
+        symmetrize (bool): whether to keep W[i,j] if either D[i,j] or D[j,i] is stored, as needed for k-nearest-neighbor distances
+
+    Returns:
+        W (sparse matrix): CSR matrix of kernel evaluations with the same sparsity pattern as 'D' (or its symmetrization)
+    """
+    W = D.copy()
+    W.data = np.exp(-np.power(W.data, 2)/(epsilon*epsilon))
+    if symmetrize:
+        # keep W[i,j] if either i or j is a neighbor of the other
+        W = W.maximum(W.T).tocsr()
+    return W
+
+
+def _distance_matrix(data, metric=_l2_distance, block_size=None, n_neighbors=None, cutoff=None, dtype=np.float64):
+    """Computes the distances from which the DMAPS kernel matrix is built: all pairwise distances, or, if 'n_neighbors' or 'cutoff' are given, the sparse matrix of distances between neighbors from '_neighbor_distances'. See 'embed_data' for a description of the arguments.
+
+    Returns:
+        D (array, sparse matrix): shape ("number of data points", "number of data points") dense array or CSR matrix of distances of type 'dtype'
+    """
+    if n_neighbors is not None or cutoff is not None:
+        return _neighbor_distances(data, metric, n_neighbors, cutoff).astype(dtype)
+    return _pairwise_distances(data, metric, block_size, dtype)
+
+
+def _kernel_from_distances(D, epsilon='mean', symmetrize=False, overwrite=False, stats=None):
+    """Evaluates the DMAPS kernel :math:`W_{ij} = e^{-D_{ij}^2/\epsilon^2}` from the distances computed by '_distance_matrix'
+
+    Args:
+        D (array, sparse matrix): shape ("number of data points", "number of data points") dense array or CSR matrix of distances
+        epsilon (string, float): one of either "median", "mean" or a float. If "median" or "mean", the "median" or "mean" of the distances between distinct points (or, for sparse 'D', distinct neighbors) is used as the epsilon value. If a float is given, this value is used.
+        symmetrize (bool): for sparse 'D', whether to keep W[i,j] if either D[i,j] or D[j,i] is stored, see '_sparse_kernel'
+        overwrite (bool): for dense 'D', whether the kernel may be evaluated in place in 'D' rather than in a copy
+        stats (dmaps_profile.Stats): if given, records the cost of the "epsilon" and "kernel" stages
+
+    Returns:
+        W (array, sparse matrix): symmetric, shape ("number of data points", "number of data points") array of kernel evaluations, in the same format and of the same type as 'D'
+        epsilon (float): the value of epsilon used in the kernel
+    """
+    if sparse.issparse(D):
+        if epsilon is "mean" or epsilon is "median":
+            with dmaps_profile.stage(stats, 'epsilon'):
+                # ignore the diagonal, just as the dense case does
+                rows = np.repeat(np.arange(D.shape[0]), np.diff(D.indptr))
+                dists = D.data[rows != D.indices]
+                epsilon = np.average(dists) if epsilon is "mean" else np.median(dists)
+        with dmaps_profile.stage(stats, 'kernel'):
+            W = _sparse_kernel(D, epsilon, symmetrize)
+        return W, epsilon
+    # m is number of data pts
+    m = D.shape[0]
+    if epsilon is "mean" or epsilon is "median":
+        with dmaps_profile.stage(stats, 'epsilon'):
+            if epsilon is "mean":
+                # number of distances, "m choose 2"
+                ndists = m*(m-1)/2
+                # calc average, divide by 2 because each distance is double counted in W
+                # important to do by hand and not by boolean indexing as certain off-diagonal values of W may be zero to numerical precision
+                epsilon = np.sum(D, dtype=np.float64)/(2.0*ndists)
+            else:
+                epsilon = np.median(D[D > 0])
+    with dmaps_profile.stage(stats, 'kernel'):
+        W = D if overwrite else D.copy()
+        # evaluate the kernel in place, without full-size temporaries
+        W *= W
+        W *= -1.0/(epsilon*epsilon)
+        np.exp(W, out=W)
+    return W, epsilon
+
+
+def _kernel_matrix(data, metric=_l2_distance, epsilon='mean', block_size=None, n_neighbors=None, cutoff=None, dtype=np.float64, stats=None):
+    """Constructs the DMAPS kernel matrix :math:`W_{ij} = e^{-d(x_i, x_j)^2/\epsilon^2}` of 'data', either dense or, if 'n_neighbors' or 'cutoff' are given, sparse, recording the "distances", "epsilon" and "kernel" stages in 'stats' if given. See 'embed_data' for a description of the arguments.
+
+    Returns:
+        W (array, sparse matrix): symmetric, shape ("number of data points", "number of data points") array of kernel evaluations
+        epsilon (float): the value of epsilon used in the kernel
+    """
+    with dmaps_profile.stage(stats, 'distances'):
+        D = _distance_matrix(data, metric, block_size, n_neighbors, cutoff, dtype)
+    return _kernel_from_distances(D, epsilon, symmetrize=n_neighbors is not None, overwrite=True, stats=stats)
+
+
+def _cached_stage(cache, key, compute):
+    """Returns the value stored under 'key' in 'cache', first computing it with compute() and storing it if it is missing. If 'key' is None, the stage is not cacheable and compute() is simply returned."""
+    if key is None:
+        return compute()
+    value = cache.load(key)
+    if value is None:
+        value = compute()
+        cache.save(key, value)
+    return value
+
+
+def _embed_data_cached(data, k, metric, epsilon, embedding_method, block_size, n_neighbors, cutoff, cache, solver, solver_options, dtype, stats):
+    """Runs 'embed_data' through 'cache', a dmaps_cache.Cache, storing the distance matrix, the kernel matrix and the eigenpairs under keys derived from the data and from only those parameters each stage depends on. A later call that changes, e.g., just 'k' or 'embedding_method' then reloads W instead of recomputing it. Stages depending on a callable that cannot be identified across runs (e.g. a lambda 'metric') are recomputed."""
+    metric_name = dmaps_cache.callable_name(metric)
+    method_name = dmaps_cache.callable_name(embedding_method)
+    solver_name = dmaps_cache.callable_name(solver)
+    distance_key = None if metric_name is None else cache.key('distances', dmaps_cache.fingerprint(data), metric_name, n_neighbors, cutoff, np.dtype(dtype).str)
+    kernel_key = None if distance_key is None else cache.key('kernel', distance_key, epsilon)
+    eigen_key = None if kernel_key is None or method_name is None or solver_name is None else cache.key('eigenpairs', kernel_key, k, method_name, solver_name, sorted((solver_options or {}).items()))
+    def compute_kernel():
+        def compute_distances():
+            with dmaps_profile.stage(stats, 'distances'):
+                return _distance_matrix(data, metric, block_size, n_neighbors, cutoff, dtype)
+        D = _cached_stage(cache, distance_key, compute_distances)
+        return _kernel_from_distances(D, epsilon, symmetrize=n_neighbors is not None, stats=stats)[0]
+    def compute_eigenpairs():
+        return embedding_method(_cached_stage(cache, kernel_key, compute_kernel), k, solver=solver, solver_options=solver_options, stats=stats)
+    eigvals, eigvects = _cached_stage(cache, eigen_key, compute_eigenpairs)
     return eigvals, eigvects
 
 
-def embed_data(data, k, metric=_l2_distance, epsilon='mean', embedding_method=_compute_embedding):
+def embed_data(data, k, metric=_l2_distance, epsilon='mean', embedding_method=_compute_embedding, block_size=None, n_neighbors=None, cutoff=None, cache=None, solver='arpack', solver_options=None, dtype=np.float64, stats=None, backend='numpy'):
     """Computes the 'k'-dimensional DMAPS embedding of 'data' using the function 'metric' to compute distances between points and 'epsilon' as the characteristic radius of the neighborhood of each point
 
     Args:
         data (iterable): typically a shape ("number of data points", "dimension of data") array containing the data as row vectors, but could be a list in which the :math:`i^{th}` entry contains :math:`i^{th}` data point, e.g. an adjacency matrix
-            metric (function): the distance measure to be used in conjunction with 'data', accepting calls like metric(data[i], data[j])
+            metric (function, string): the distance measure to be used in conjunction with 'data', accepting calls like metric(data[i], data[j]), or the name of a metric understood by scipy.spatial.distance.cdist. When 'data' is an array, the default l2 distance and scipy metrics are computed in vectorized form.
         k (int): number of dimensions to embed into
         epsilon (string, float): one of either "median", "mean" or a float. If "median" or "mean", the "median" or "mean" of the distances between all points is used as the epsilon value. If a float is given, this value is used.
+        block_size (int): number of rows of the distance matrix computed at once when distances are vectorized, bounding the size of temporaries. If None, the whole matrix is computed at once.
+        n_neighbors (int): if given, W is built as a sparse matrix keeping only the kernel between each point and its 'n_neighbors' nearest neighbors (including itself), symmetrized so that W[i,j] is kept if either point is a neighbor of the other. Requires array 'data' and one of the metrics supported by '_minkowski_p'.
+        cutoff (float): if given, W is built as a sparse matrix keeping only the kernel between points within distance 'cutoff' of each other. May be combined with 'n_neighbors'.
+
+        .. note::
+            In sparse mode, "mean" and "median" values of epsilon are taken over the distances between distinct neighbors only, and so are smaller than their dense counterparts.
+
+        cache (dmaps_cache.Cache): if given, the distance matrix, kernel matrix and eigenpairs are stored in and reused from this on-disk cache, keyed by the data and the parameters each depends on
+        solver (string, function): the eigensolver, one of "arpack", "lobpcg" or "randomized", see 'dmaps_solvers'
+        solver_options (dict): additional keyword arguments for 'solver', e.g. {'tol': 1e-8, 'maxiter': 200}
+        dtype (type): the type in which the distance and kernel matrices are stored and multiplied, e.g. numpy.float32 to halve their memory. Degree sums and the eigensolver's vectors are computed in double precision regardless, as are distances under the default l2 and scipy metrics (even from single precision 'data'), so single precision only rounds the entries of W. Python metrics are evaluated in whatever precision they use.
+        stats (dmaps_profile.Stats): if given, records the time and memory taken by each stage of the embedding: "distances", "epsilon" (if "mean" or "median"), "kernel", "normalization" and "eigensolve". With a 'cache', only the stages actually computed are recorded.
+        backend (string): "numpy" for the implementation in this module, or "native" to compute the kernel matrix and eigenpairs with the C++ implementation through 'dmaps_native', which requires array 'data' and the defaults of every other argument except 'epsilon' and 'stats'. The whole native computation is recorded as a single "native" stage.
 
     Returns:
         eigvals (array): shape (k) vector with first 'k' eigenvectors of DMAPS embedding sorted from largest to smallest
@@ -99,87 +502,767 @@ def embed_data(data, k, metric=_l2_distance, epsilon='mean', embedding_method=_c
     >>> from plot_dmaps import plot_embeddings
     >>> plot_embeddings(eigvects, eigvals, k=3)
     """
-    # m is number of data pts, len should work in all cases
-    m = len(data)
-    W = np.empty([m, m])
-    # first populate W with metrics
-    for i in xrange(m):
-        W[i,i] = 0
-        for j in xrange(i+1, m):
-            W[i,j] = metric(data[i], data[j])
-            W[j,i] = W[i,j]
-    if epsilon is "mean":
-        # number of distances, "m choose 2"
-        ndists = m*(m-1)/2
-        # calc average, divide by 2 because each distance is double counted in W
-        # important to do by hand and not by boolean indexing as certain off-diagonal values of W may be zero to numerical precision
-        epsilon = np.sum(W)/(2.0*ndists)
-    elif epsilon is "median":
-        epsilon = np.median(W[W > 0])
-    W = np.exp(-np.power(W, 2)/(epsilon*epsilon))
-    eigvals, eigvects = embedding_method(W, k)
+    if backend == 'native':
+        if metric is not _l2_distance or embedding_method is not _compute_embedding or n_neighbors is not None or cutoff is not None or cache is not None or solver != 'arpack' or solver_options is not None or np.dtype(dtype) != np.float64:
+            raise ValueError('the native backend supports only the default metric, embedding_method, solver and dtype in dense mode without a cache')
+        if epsilon is "mean" or epsilon is "median":
+            with dmaps_profile.stage(stats, 'epsilon'):
+                dists = pdist(data)
+                # match the dense numpy backend, whose median ignores zero distances
+                epsilon = np.average(dists) if epsilon is "mean" else np.median(dists[dists > 0])
+        with dmaps_profile.stage(stats, 'native'):
+            return dmaps_native.map(data, k, epsilon)
+    elif backend != 'numpy':
+        raise ValueError('unknown backend ' + repr(backend))
+    if cache is not None:
+        return _embed_data_cached(data, k, metric, epsilon, embedding_method, block_size, n_neighbors, cutoff, cache, solver, solver_options, dtype, stats)
+    W, epsilon = _kernel_matrix(data, metric, epsilon, block_size, n_neighbors, cutoff, dtype, stats)
+    eigvals, eigvects = embedding_method(W, k, solver=solver, solver_options=solver_options, stats=stats)
     return eigvals, eigvects
 
 
-def embed_data_customkernel(data, k, kernel, symmetric=False):
-    """Computes the 'k'-dimensional DMAPS embedding of 'data' using the function 'kernel' to evaluate the DMAPS kernel between points and 'epsilon' as the characteristic radius of the neighborhood of each point. **Typically 'embed_data' should be used which employs the default exponential kernel with a potentially customized metric between points.**
+def _distance_tiles(data, metric, block_size):
+    """Iterates over the square tiles on and above the diagonal of the pairwise distance matrix of 'data', reading only the two row blocks of 'data' that each tile needs
 
     Args:
-        data (iterable): typically a shape ("number of data points", "dimension of data") array containing the data as row vectors, but could be a list in which the :math:`i^{th}` entry contains :math:`i^{th}` data point, e.g. an adjacency matrix
-        kernel (function): the kernel to be used in conjunction with 'data', accepting calls like kernel(data[i], data[j])
+        data (array): shape ("number of data points", "dimension of data") array, typically a numpy.memmap
+        metric (function, string): the distance measure, see '_cdist'
+        block_size (int): the side length of each tile
+
+    Yields:
+        start_i (int): the first row of the tile
+        start_j (int): the first column of the tile, with start_j >= start_i
+        D (array): the tile D[start_i:start_i+block_size, start_j:start_j+block_size] of the distance matrix
+    """
+    m = data.shape[0]
+    for start_i in xrange(0, m, block_size):
+        X = np.asarray(data[start_i:start_i+block_size])
+        for start_j in xrange(start_i, m, block_size):
+            if start_j == start_i:
+                D = _cdist(X, X, metric)
+                # self-distances are zero by definition, discard roundoff
+                np.fill_diagonal(D, 0)
+            else:
+                D = _cdist(X, np.asarray(data[start_j:start_j+block_size]), metric)
+            yield start_i, start_j, D
+
+
+# the number of random pairs of points from which 'embed_data_streamed' estimates the median distance
+_median_samples = 10**6
+
+
+def embed_data_streamed(data, k, metric=_l2_distance, epsilon='mean', embedding_method=_compute_embedding, block_size=1000, weight_threshold=None, filename=None, solver='arpack', solver_options=None, dtype=np.float64):
+    """Computes the 'k'-dimensional DMAPS embedding of 'data' for datasets whose kernel matrix does not fit in memory. The data is read and the kernel evaluated one (block_size, block_size) tile at a time, and W is either written to a memory-mapped file on disk or, if a 'weight_threshold' is given, accumulated as a sparse matrix of its significant entries. The eigensolver then multiplies by the on-disk W one row block at a time, so peak memory is set by 'block_size' rather than by the square of the number of points.
+
+    Args:
+        data (array, string): shape ("number of data points", "dimension of data") array containing the data as row vectors, typically a numpy.memmap, or the filename of a .npy file which is then memory-mapped
         k (int): number of dimensions to embed into
+        metric (function, string): the distance measure, see 'embed_data'
+        epsilon (string, float): one of either "median", "mean" or a float. If "mean", the mean of the distances between all points is used, which requires an additional pass over the data. If "median", the median is estimated from a random sample of pairs of points, see 'epsilon_statistics'.
+        embedding_method (function): either '_compute_embedding' or '_compute_embedding_laplace_beltrami'
+        block_size (int): the side length of the tiles of W computed at once
+        weight_threshold (float): if given, entries of W smaller than 'weight_threshold' are set to zero and W is stored as a sparse matrix in memory, as in the C++ 'dmaps::map'
+        filename (string): the file in which the dense W is stored. If None, an anonymous temporary file is used and removed once the embedding is computed.
+        solver (string, function): the eigensolver, see 'embed_data'. The block solvers "lobpcg" and "randomized" read the on-disk W once per block of vectors rather than once per vector.
+        solver_options (dict): additional keyword arguments for 'solver'
+        dtype (type): the type in which W is stored, see 'embed_data'
 
+    Returns:
+        eigvals (array): shape (k) vector with first 'k' eigenvectors of DMAPS embedding sorted from largest to smallest
+        eigvects (array): shape ("number of data points", k) array with the k-dimensional DMAPS-embedding eigenvectors. eigvects[:,i] corresponds to the eigenvector of the :math:`i^{th}`-largest eigenvalue, eigval[i].
+
+    >>> np.save('swissroll.npy', gen_swissroll())
+    >>> eigvals, eigvects = embed_data_streamed('swissroll.npy', k=4, epsilon=2.5, block_size=500)
+    """
+    if isinstance(data, str):
+        data = np.load(data, mmap_mode='r')
+    m = data.shape[0]
+    if epsilon is "mean":
+        total = 0.0
+        for start_i, start_j, D in _distance_tiles(data, metric, block_size):
+            # tiles above the diagonal stand in for their transposes below it
+            total += np.sum(D) if start_i == start_j else 2*np.sum(D)
+        epsilon = total/(m*(m-1.0))
+    elif epsilon is "median":
+        epsilon = epsilon_statistics(data, metric=metric, nsamples=min(_median_samples, m*(m-1)/2))[3]
+    if weight_threshold is None:
+        W = np.memmap(tempfile.TemporaryFile() if filename is None else filename, dtype=dtype, mode='w+', shape=(m, m))
+    else:
+        rows, cols, vals = [], [], []
+    for start_i, start_j, K in _distance_tiles(data, metric, block_size):
+        # evaluate the kernel in place
+        K *= K
+        K /= -epsilon*epsilon
+        np.exp(K, out=K)
+        if weight_threshold is None:
+            W[start_i:start_i+K.shape[0], start_j:start_j+K.shape[1]] = K
+            if start_j != start_i:
+                W[start_j:start_j+K.shape[1], start_i:start_i+K.shape[0]] = K.T
+        else:
+            tile_rows, tile_cols = np.nonzero(K >= weight_threshold)
+            tile_vals = K[tile_rows, tile_cols].astype(dtype)
+            rows.append(tile_rows + start_i)
+            cols.append(tile_cols + start_j)
+            vals.append(tile_vals)
+            if start_j != start_i:
+                rows.append(tile_cols + start_j)
+                cols.append(tile_rows + start_i)
+                vals.append(tile_vals)
+    if weight_threshold is None:
+        W.flush()
+        return embedding_method(_blocked_operator(W, block_size), k, solver=solver, solver_options=solver_options)
+    W = sparse.coo_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))), shape=(m, m)).tocsr()
+    return embedding_method(W, k, solver=solver, solver_options=solver_options)
+
+
+def _select_landmarks(data, n_landmarks, landmark_method='random', metric=_l2_distance, random_state=np.random):
+    """Chooses 'n_landmarks' representative points of 'data'
+
+    Args:
+        data (iterable): the data, see 'embed_data'
+        n_landmarks (int): the number of landmarks
+        landmark_method (string): one of "random", a uniform random subset of the data, "kmeans", the centroids of a k-means clustering of (a random subset of at most 50 * 'n_landmarks' of) the data, which requires array data and Euclidean distances, or "farthest", greedy farthest-point sampling under 'metric', which spreads landmarks evenly over the data regardless of its density
+        metric (function, string): the distance measure, see 'embed_data'
+        random_state (RandomState): source of randomness
+
+    Returns:
+        landmarks (iterable): the landmark points, an array if 'data' is an array and a list otherwise
+    """
+    m = len(data)
+    if landmark_method == 'random':
+        indices = np.sort(random_state.choice(m, n_landmarks, replace=False))
+    elif landmark_method == 'kmeans':
+        from scipy.cluster.vq import kmeans2
+        sample = np.asarray(data[np.sort(random_state.choice(m, min(m, 50*n_landmarks), replace=False))], dtype=float)
+        centroids, _ = kmeans2(sample, sample[random_state.choice(sample.shape[0], n_landmarks, replace=False)], iter=10, minit='matrix')
+        return centroids
+    elif landmark_method == 'farthest':
+        indices = [random_state.randint(m)]
+        min_dists = _cdist(data[indices[0]:indices[0]+1], data, metric)[0]
+        for i in xrange(1, n_landmarks):
+            indices.append(np.argmax(min_dists))
+            np.minimum(min_dists, _cdist(data[indices[-1]:indices[-1]+1], data, metric)[0], out=min_dists)
+    else:
+        raise ValueError('unknown landmark_method ' + repr(landmark_method))
+    if isinstance(data, np.ndarray):
+        return data[indices]
+    return [data[i] for i in indices]
+
+
+def embed_data_landmarks(data, k, n_landmarks, metric=_l2_distance, epsilon='mean', landmark_method='random', embedding_method=_compute_embedding, block_size=1000, n_neighbors=None, seed=None):
+    """Computes an approximate 'k'-dimensional DMAPS embedding of 'data' from its kernel against 'n_landmarks' landmark points, using O(npts * n_landmarks) time and memory instead of the O(npts^2) of 'embed_data'.
+
+    The kernel matrix is approximated by :math:`W \simeq B B^T`, :math:`B_{il} = \sqrt{w_l} \exp(-2 \|x_i - z_l\|^2/\epsilon^2)`, where the :math:`z_l` are the landmarks and :math:`w_l` the inverse of the landmark density at :math:`z_l`. :math:`(B B^T)_{ij}` is then a quadrature over the landmarks of :math:`\int \exp(-2 \|x_i - z\|^2/\epsilon^2) \exp(-2 \|x_j - z\|^2/\epsilon^2) dz`, which is proportional to the exact kernel :math:`\exp(-\|x_i - x_j\|^2/\epsilon^2)`. After the usual DMAPS normalization :math:`S B B^T S`, the eigenpairs are found from the (n_landmarks, n_landmarks) matrix :math:`(S B)^T (S B)` and lifted to every point through :math:`S B`.
+
+    Args:
+        data (iterable): the data, see 'embed_data'
+        k (int): number of dimensions to embed into, at most 'n_landmarks'
+        n_landmarks (int): the number of landmarks. The approximation improves as the landmarks become dense relative to 'epsilon'.
+        metric (function, string): the distance measure, see 'embed_data'
+        epsilon (string, float): one of either "median", "mean" or a float. "mean" and "median" are estimated from a random sample of pairs of points, see 'epsilon_statistics', and require array 'data'.
+        landmark_method (string): one of "random", "kmeans" or "farthest", see '_select_landmarks'
+        embedding_method (function): either '_compute_embedding' or '_compute_embedding_laplace_beltrami', selecting the normalization applied to the approximate W
+        block_size (int): the number of points whose kernel against the landmarks is evaluated at once, bounding the size of temporaries
+        n_neighbors (int): if given, each point keeps only its kernel against its 'n_neighbors' nearest landmarks and B is stored as a sparse matrix, reducing memory to O(npts * n_neighbors). Requires array 'data' and one of the metrics supported by '_minkowski_p'.
+        seed (int): seed for the random choices made in selecting landmarks
 
     Returns:
         eigvals (array): shape (k) vector with first 'k' eigenvectors of DMAPS embedding sorted from largest to smallest
         eigvects (array): shape ("number of data points", k) array with the k-dimensional DMAPS-embedding eigenvectors. eigvects[:,i] corresponds to the eigenvector of the :math:`i^{th}`-largest eigenvalue, eigval[i].
+
+    >>> from test_dmaps import gen_swissroll
+    >>> swissroll_data = gen_swissroll()
+    >>> eigvals, eigvects = embed_data_landmarks(swissroll_data, k=4, n_landmarks=500, epsilon=2.5, landmark_method='farthest')
+    """
+    m = len(data)
+    random_state = np.random.RandomState(seed)
+    if epsilon is "mean" or epsilon is "median":
+        statistics = epsilon_statistics(data, metric=metric, nsamples=min(_median_samples, m*(m-1)/2), seed=seed)
+        epsilon = statistics[2] if epsilon is "mean" else statistics[3]
+    landmarks = _select_landmarks(data, n_landmarks, landmark_method, metric, random_state)
+    # the kernel with half the squared width, whose convolution with itself is the DMAPS kernel
+    half_width = epsilon*epsilon/2
+    K_landmarks = _pairwise_distances(landmarks, metric)
+    K_landmarks *= K_landmarks
+    K_landmarks /= -half_width
+    landmark_weights_half = 1/np.sqrt(np.sum(np.exp(K_landmarks, out=K_landmarks), 1))
+    if n_neighbors is not None:
+        B = _neighbor_distances(landmarks, metric, n_neighbors, query=data)
+        B.data = np.exp(-np.power(B.data, 2)/half_width)
+        B = B.dot(sparse.diags(landmark_weights_half)).tocsr()
+    else:
+        B = np.empty((m, n_landmarks))
+        for start in xrange(0, m, block_size):
+            block = B[start:start+block_size]
+            block[:] = _cdist(data[start:start+block_size], landmarks, metric)
+            block *= block
+            block /= -half_width
+            np.exp(block, out=block)
+            block *= landmark_weights_half
+    # the row sums of B B^T, and the normalization of '_compute_embedding' or '_compute_embedding_laplace_beltrami'
+    row_sums = B.dot(np.asarray(B.sum(0)).ravel())
+    if embedding_method is _compute_embedding_laplace_beltrami:
+        local_density_estimate_inv = 1/row_sums
+        D_half_inv = 1/np.sqrt(local_density_estimate_inv*B.dot(B.T.dot(local_density_estimate_inv)))
+        scaling = local_density_estimate_inv*D_half_inv
+    else:
+        D_half_inv = 1/np.sqrt(row_sums)
+        scaling = D_half_inv
+    if sparse.issparse(B):
+        B = sparse.diags(scaling).dot(B)
+        gram = B.T.dot(B).toarray()
+    else:
+        B *= scaling[:, np.newaxis]
+        gram = np.dot(B.T, B)
+    # the nonzero eigenvalues of S B B^T S and (S B)^T (S B) coincide, with eigenvectors related by S B
+    eigvals, eigvects = np.linalg.eigh(gram)
+    eigvals, eigvects = eigvals[-k:], eigvects[:, -k:]
+    eigvects = B.dot(eigvects)/np.sqrt(eigvals)
+    return _normalized_eigenpairs(eigvals, eigvects, D_half_inv)
+
+
+# the number of logarithmically spaced bins of squared distances summarized by '_squared_distance_bins'
+_kernel_sum_bins = 2**14
+# squared distances up to this fraction of the largest one are roundoff-level and gathered into a single bin by '_squared_distance_bins', bounding the range, and thus the width, of the others
+_kernel_sum_floor = 1e-16
+
+
+def _squared_distance_bins(D2, block_size, nbins=_kernel_sum_bins):
+    """Summarizes the squared distances 'D2' for '_kernel_sums' by the number, sum and sum of squares of the entries falling into each of 'nbins' logarithmically spaced bins, reading 'block_size' rows at a time. Entries up to '_kernel_sum_floor' times the largest one, including the zeros, go into an additional first bin, so that the others span at most ln(1/_kernel_sum_floor) and have a relative width of at most ln(1/_kernel_sum_floor)/nbins.
+
+    Args:
+        D2 (array): shape (m, m) array of squared distances
+        block_size (int): the number of rows of 'D2' processed at once, bounding the size of temporaries
+        nbins (int): the number of logarithmically spaced bins
+
+    Returns:
+        counts (array): shape (nbins + 1) vector of the number of entries in each bin
+        sums (array): shape (nbins + 1) vector of the sum of the entries in each bin
+        sums_squared (array): shape (nbins + 1) vector of the sum of the squares of the entries in each bin
+    """
+    m = D2.shape[0]
+    hi = max(np.max(D2[start:start+block_size]) for start in xrange(0, m, block_size))
+    counts, sums, sums_squared = np.zeros(nbins + 1), np.zeros(nbins + 1), np.zeros(nbins + 1)
+    if hi <= 0:
+        counts[0] = D2.size
+        return counts, sums, sums_squared
+    floor = hi*_kernel_sum_floor
+    lo = hi
+    for start in xrange(0, m, block_size):
+        block = D2[start:start+block_size]
+        above = block[block > floor]
+        if above.shape[0] > 0:
+            lo = min(lo, np.min(above))
+    bins_per_log = nbins/max(np.log(hi/lo), 1e-300)
+    for start in xrange(0, m, block_size):
+        block = D2[start:start+block_size].ravel()
+        bins = np.zeros(block.shape[0], dtype=int)
+        above = block > floor
+        bins[above] = 1 + np.minimum(((np.log(block[above]) - np.log(lo))*bins_per_log).astype(int), nbins - 1)
+        counts += np.bincount(bins, minlength=nbins + 1)
+        sums += np.bincount(bins, weights=block, minlength=nbins + 1)
+        sums_squared += np.bincount(bins, weights=block*block, minlength=nbins + 1)
+    return counts, sums, sums_squared
+
+
+def _kernel_sums(bins, epsilons):
+    """Computes :math:`\sum_{i,j} e^{-D_{ij}^2/\epsilon^2}` for each of 'epsilons' from the bins of squared distances of '_squared_distance_bins', in O(nbins) time per :math:`\epsilon`. Within each bin, :math:`\sum e^{-a s} \approx n e^{-a \mu} (1 + a^2 \sigma^2/2)` where :math:`n`, :math:`\mu` and :math:`\sigma^2` are the number, mean and variance of its squared distances :math:`s` and :math:`a = 1/\epsilon^2`. The neglected third order term gives each bin a relative error of order :math:`(a \Delta)^3`, where :math:`\Delta` is the spread of its squared distances: at most :math:`\mu \delta` for the logarithmic bins of relative width :math:`\delta` (see '_squared_distance_bins'), and at most '_kernel_sum_floor' times the largest squared distance for the first bin. The sums are thus accurate at every :math:`\epsilon` for which :math:`a \Delta \ll 1` in the bins carrying most of the sum, e.g. to about 1e-13 on a swissroll with the default 2**14 bins.
+
+    Returns:
+        w_sums (array): shape (nepsilons) vector of the kernel sums
+    """
+    counts, sums, sums_squared = bins
+    occupied = counts > 0
+    counts = counts[occupied]
+    means = sums[occupied]/counts
+    variances = np.maximum(sums_squared[occupied]/counts - means*means, 0)
+    w_sums = np.empty(len(epsilons))
+    for i, epsilon in enumerate(epsilons):
+        a = 1.0/(epsilon*epsilon)
+        w_sums[i] = np.sum(counts*np.exp(-a*means)*(1 + 0.5*a*a*variances))
+    return w_sums
+
+
+def epsilon_sweep(data, epsilons, metric=_l2_distance, block_size=None, n_neighbors=None, cutoff=None, k=None, embedding_method=_compute_embedding, solver='arpack', solver_options=None):
+    """Computes :math:`\sum_{i,j} W_{ij}(\epsilon)` of the default exponential kernel for every value in 'epsilons' from a single computation of the pairwise distances (or, in sparse mode, of the neighbor graph), as 'kernel_plot' does for arbitrary kernels by evaluating each of them separately. In dense mode the squared distances are binned once (see '_kernel_sums'), after which each :math:`\epsilon` costs only a reduction over the bins rather than :math:`m^2` exponentials. Reasonable :math:`\epsilon` values fall in the linear range of a log-log plot of the sums. Optionally, the 'k'-dimensional embedding is also computed at each :math:`\epsilon`, each eigensolve being warm-started from the eigenvectors found at the previous value.
+
+    Args:
+        data (iterable): the data, see 'embed_data'
+        epsilons (array): vector of :math:`\epsilon` values to sweep, preferably sorted so that consecutive embeddings are similar
+        metric (function, string): the distance measure, see 'embed_data'
+        block_size (int): the number of rows of the distance matrix computed (see '_pairwise_distances') and binned at once in dense mode, bounding the size of temporaries. If None, distances are computed at once and binned in blocks of about '_conversion_block_entries' entries.
+        n_neighbors (int): the number of nearest neighbors in sparse mode, see 'embed_data'
+        cutoff (float): the neighbor cutoff in sparse mode, see 'embed_data'
+        k (int): if given, the number of dimensions to embed into at each :math:`\epsilon`
+        embedding_method (function): either '_compute_embedding' or '_compute_embedding_laplace_beltrami'
+        solver (string, function): the eigensolver, see 'embed_data'. "lobpcg" makes the most of the warm starts, as it starts from all of the previous eigenvectors rather than a single combination of them.
+        solver_options (dict): additional keyword arguments for 'solver'
+
+    Returns:
+        w_sums (array): shape (nepsilons) vector in which w_sums[i] is :math:`\sum_{i,j} W_{ij}` for epsilons[i]
+        embeddings (list): if 'k' is given, a list of the (eigvals, eigvects) pairs computed at each of 'epsilons', otherwise None
+
+    >>> from test_dmaps import gen_swissroll
+    >>> swissroll_data = gen_swissroll()
+    >>> epsilons = np.logspace(-1, 2, 20)
+    >>> w_sums, embeddings = epsilon_sweep(swissroll_data, epsilons)
+    """
+    nepsilons = len(epsilons)
+    w_sums = np.zeros(nepsilons)
+    sparse_mode = n_neighbors is not None or cutoff is not None
+    if sparse_mode:
+        D = _neighbor_distances(data, metric, n_neighbors, cutoff)
+        for i, epsilon in enumerate(epsilons):
+            w_sums[i] = _sparse_kernel(D, epsilon, symmetrize=n_neighbors is not None).sum()
+    else:
+        # only squared distances are needed from here on
+        D = _pairwise_distances(data, metric, block_size)
+        D *= D
+        m = D.shape[0]
+        rows_per_block = max(1, _conversion_block_entries/m) if block_size is None else block_size
+        w_sums = _kernel_sums(_squared_distance_bins(D, rows_per_block), epsilons)
+    if k is None:
+        return w_sums, None
+    embeddings = []
+    v0 = None
+    # the eigensolver keeps no reference to W, so each dense W is evaluated in place in the same array
+    W_buffer = None if sparse_mode else np.empty_like(D)
+    for epsilon in epsilons:
+        if sparse_mode:
+            W = _sparse_kernel(D, epsilon, symmetrize=n_neighbors is not None)
+        else:
+            W = np.multiply(D, -1.0/(epsilon*epsilon), out=W_buffer)
+            np.exp(W, out=W)
+        eigvals, eigvects = embedding_method(W, k, v0=v0, solver=solver, solver_options=solver_options)
+        embeddings.append((eigvals, eigvects))
+        # the leading eigenvectors vary smoothly with epsilon, so they are a good start for the next solve
+        v0 = eigvects
+    return w_sums, embeddings
+
+
+class DMAPS_Model:
+    """A DMAPS embedding fitted to a set of training data that retains everything needed to place new points into the same embedding with the Nystrom extension, i.e. without recomputing the kernel matrix or its eigendecomposition. A new point :math:`x` is embedded as :math:`\psi_k(x) = \frac{1}{\lambda_k} \sum_j p(x, x_j) \psi_k(x_j)` where :math:`p(x, x_j)` is the Markov matrix entry between :math:`x` and training point :math:`x_j`, which reproduces the training eigenvectors exactly at the training points.
+
+    With 'incremental' set, the model also keeps W and its row sums so that points can be appended with 'add_points' or dropped with 'remove_points'. Only the rows and columns of W involving the changed points are evaluated and written, and the eigensolver is warm-started from the previous eigenvectors, most effectively with solver="lobpcg". In dense mode each training point occupies a slot, i.e. a row and column, of W: removed points free their slots, which are reused by later additions, so that e.g. a rolling window of points never copies W.
+
+    The constructor accepts the same arguments as 'embed_data', plus 'incremental'.
+
+    Attributes:
+        data (iterable): the training data
+        metric (function, string): the distance measure used in the kernel
+        epsilon (float): the value of epsilon used in the kernel, after resolving "mean" or "median"
+        n_neighbors (int): the number of nearest neighbors used in sparse mode, or None
+        cutoff (float): the neighbor cutoff used in sparse mode, or None
+        eigvals (array): shape (k) vector with first 'k' eigenvectors of DMAPS embedding sorted from largest to smallest
+        eigvects (array): shape ("number of data points", k) array with the k-dimensional DMAPS-embedding eigenvectors of the training data
+        _density_inv (array): shape ("number of data points") inverse local density estimates used by '_compute_embedding_laplace_beltrami', or None if the embedding did not normalize by density
+        _tree (cKDTree): KD-tree of the training data used to find neighbors of new points in sparse mode
+        _W (array, sparse matrix): the kernel matrix of the training data, kept only if 'incremental'. In dense mode, an array of at least "number of data points" rows and columns holding the kernel between the points in '_slots', with zeros in every unused row and column.
+        _slots (array): in dense incremental mode, the row and column of '_W' of each training point
+        _free_slots (array): in dense incremental mode, the sorted unused rows and columns of '_W', which are filled before '_W' is grown
+        _row_sums (array): the row sums of the kernel matrix of the training data, kept only if 'incremental'
+
+    >>> from test_dmaps import gen_swissroll
+    >>> swissroll_data = gen_swissroll()
+    >>> model = DMAPS_Model(swissroll_data[:4000], k=4, epsilon=2.5)
+    >>> new_eigvects = model.transform(swissroll_data[4000:])
+    """
+
+    def __init__(self, data, k, metric=_l2_distance, epsilon='mean', embedding_method=_compute_embedding, block_size=None, n_neighbors=None, cutoff=None, incremental=False, solver='arpack', solver_options=None):
+        """Computes the DMAPS embedding of the training set 'data'"""
+        if incremental and n_neighbors is not None:
+            raise ValueError('incremental updates are not supported with n_neighbors, as adding points changes the neighbors of existing points')
+        self.data = data
+        self.metric = metric
+        self.n_neighbors = n_neighbors
+        self.cutoff = cutoff
+        self._k = k
+        self._embedding_method = embedding_method
+        self._block_size = block_size
+        self._solver = solver
+        self._solver_options = solver_options
+        W, self.epsilon = _kernel_matrix(data, metric, epsilon, block_size, n_neighbors, cutoff)
+        row_sums = _row_sums(W)
+        self.eigvals, self.eigvects = embedding_method(W, k, row_sums=row_sums, solver=solver, solver_options=solver_options)
+        self._density_inv = None
+        if embedding_method is _compute_embedding_laplace_beltrami:
+            self._density_inv = 1/row_sums
+        self._tree = None
+        if n_neighbors is not None or cutoff is not None:
+            self._tree = cKDTree(data)
+        self._W, self._row_sums, self._slots = None, None, None
+        if incremental:
+            self._W, self._row_sums = W, row_sums
+            if not sparse.issparse(W):
+                self._slots = np.arange(W.shape[0])
+                self._free_slots = np.empty(0, dtype=int)
+
+    def _kernel_rows(self, new_points):
+        """Evaluates the kernel between each of 'new_points' and every training point, returning a dense array or, in sparse mode, a CSR matrix of shape (len(new_points), "number of data points")"""
+        if self._tree is not None:
+            K = _neighbor_distances(self.data, self.metric, self.n_neighbors, self.cutoff, query=new_points, tree=self._tree)
+            K.data = np.exp(-np.power(K.data, 2)/(self.epsilon*self.epsilon))
+            return K
+        K = _cdist(new_points, self.data, self.metric)
+        K *= K
+        K /= -self.epsilon*self.epsilon
+        return np.exp(K, out=K)
+
+    def transform(self, new_points, block_size=1000):
+        """Embeds 'new_points' with the Nystrom extension of the training eigenvectors. The kernel between new and training points is evaluated 'block_size' new points at a time, so each block costs O(block_size * "number of data points") time and memory in dense mode and O(block_size * n_neighbors) in sparse mode.
+
+        .. note::
+            New points with no training points in their neighborhood (possible in sparse mode with a 'cutoff') cannot be extended and are assigned nan.
+
+        Args:
+            new_points (iterable): the points to embed, in the same format as the training data
+            block_size (int): the number of new points processed at once
+
+        Returns:
+            new_eigvects (array): shape (len(new_points), k) array in which new_eigvects[i] contains the embedding coordinates of new_points[i], corresponding to the rows of 'eigvects'
+        """
+        nnew = len(new_points)
+        new_eigvects = np.empty((nnew, self.eigvals.shape[0]), dtype=self.eigvects.dtype)
+        for start in xrange(0, nnew, block_size):
+            stop = min(start + block_size, nnew)
+            new_eigvects[start:stop] = self._extend(self._kernel_rows(new_points[start:stop]))
+        return new_eigvects
+
+    def _extend(self, K):
+        """Returns the Nystrom extension of the training eigenvectors to the points whose kernel with every training point is 'K', as returned by '_kernel_rows'. Points with no kernel mass are assigned nan."""
+        if self._density_inv is not None:
+            # normalize by the training density, the new point's own density cancels in the row normalization below
+            K = K.dot(sparse.diags(self._density_inv)) if sparse.issparse(K) else K*self._density_inv
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return K.dot(self.eigvects)/_row_sums(K)[:, np.newaxis]/self.eigvals
+
+    def _kernel_operator(self):
+        """Returns the kernel matrix of the training data held in '_W': in sparse mode '_W' itself, and in dense mode '_W' wrapped in a LinearOperator gathering the training points from their slots, unless they already fill it in order. '_W' is always multiplied whole, as products with a strided view of part of it are several times slower."""
+        if self._slots is None:
+            return self._W
+        W, slots = self._W, self._slots
+        used = W.shape[0]
+        if slots.shape[0] == used and np.all(slots == np.arange(used)):
+            return W
+        def matvec(x):
+            x_slots = np.zeros(used)
+            x_slots[slots] = np.ravel(x)
+            return W.dot(x_slots)[slots]
+        def matmat(X):
+            X_slots = np.zeros((used, X.shape[1]))
+            X_slots[slots] = X
+            return W.dot(X_slots)[slots]
+        return spla.LinearOperator((slots.shape[0], slots.shape[0]), matvec=matvec, matmat=matmat, dtype=W.dtype)
+
+    def _allocate_slots(self, nslots):
+        """Returns 'nslots' unused slots of '_W', taking free slots first and growing '_W' by the slots still needed if there are too few"""
+        nfree = min(nslots, self._free_slots.shape[0])
+        m = self._W.shape[0]
+        slots = np.concatenate((self._free_slots[:nfree], np.arange(m, m + nslots - nfree)))
+        self._free_slots = self._free_slots[nfree:]
+        if nslots > nfree:
+            # an O(m^2) copy, but no more than a single product with W in the eigensolve that follows
+            W = np.zeros((m + nslots - nfree, m + nslots - nfree), dtype=self._W.dtype)
+            W[:m, :m] = self._W
+            self._W = W
+        return slots
+
+    def _refresh_embedding(self, v0):
+        """Recomputes the eigenpairs of the updated '_W', starting the eigensolver from 'v0'"""
+        self.eigvals, self.eigvects = self._embedding_method(self._kernel_operator(), self._k, v0=v0, row_sums=self._row_sums, solver=self._solver, solver_options=self._solver_options)
+        if self._density_inv is not None:
+            self._density_inv = 1/self._row_sums
+
+    def add_points(self, new_points):
+        """Appends 'new_points' to the training data and updates the embedding. Only the kernel between the new points and all points is evaluated and written into W, at O(len(new_points) * "number of data points") cost, and the row sums of W are updated in place. In dense mode the new points take the slots of removed points where possible, so that W is only written, not copied; only points beyond the free slots grow W, an O("number of data points"^2) copy. The eigensolver is started from the Nystrom extension of the current eigenvectors to the new points. Requires a model created with 'incremental'.
+
+        Args:
+            new_points (iterable): the points to add, in the same format as the training data
+        """
+        if self._W is None:
+            raise ValueError('add_points requires a DMAPS_Model created with incremental=True')
+        # kernel between new and old points, and among the new points
+        K = self._kernel_rows(new_points)
+        # warm start from the current embedding, extended to the new points. Points without kernel mass (e.g. beyond the cutoff, or outliers whose kernel underflows) cannot be extended and are left to the eigensolver.
+        v0_new = self._extend(K)
+        v0_new[~np.all(np.isfinite(v0_new), 1)] = 0
+        v0 = np.concatenate((self.eigvects, v0_new))
+        if self._tree is not None:
+            K_new = _sparse_kernel(_neighbor_distances(new_points, self.metric, cutoff=self.cutoff), self.epsilon)
+            self._W = sparse.bmat([[self._W, K.T], [K, K_new]], format='csr')
+        else:
+            K_new, _ = _kernel_from_distances(_pairwise_distances(new_points, self.metric), self.epsilon, overwrite=True)
+            new_slots = self._allocate_slots(K.shape[0])
+            self._W[np.ix_(new_slots, self._slots)] = K
+            self._W[np.ix_(self._slots, new_slots)] = K.T
+            self._W[np.ix_(new_slots, new_slots)] = K_new
+            self._slots = np.concatenate((self._slots, new_slots))
+        self._row_sums = np.concatenate((self._row_sums + _row_sums(K.T), _row_sums(K) + _row_sums(K_new)))
+        if isinstance(self.data, np.ndarray):
+            self.data = np.concatenate((self.data, new_points))
+        else:
+            self.data = list(self.data) + list(new_points)
+        if self._tree is not None:
+            self._tree = cKDTree(self.data)
+        self._refresh_embedding(v0)
+
+    def remove_points(self, indices):
+        """Removes the training points at 'indices' and updates the embedding. The row sums of W are updated by subtracting only the removed columns, and in dense mode the removed rows and columns of W are zeroed and their slots freed rather than W being copied, at O(len(indices) * "number of data points") cost. The eigensolver is started from the current eigenvectors of the remaining points. Requires a model created with 'incremental'.
+
+        Args:
+            indices (array): indices into the current training data of the points to remove
+        """
+        if self._W is None:
+            raise ValueError('remove_points requires a DMAPS_Model created with incremental=True')
+        keep = np.ones(self.eigvects.shape[0], dtype=bool)
+        keep[indices] = False
+        kept = np.flatnonzero(keep)
+        removed = np.flatnonzero(~keep)
+        v0 = self.eigvects[kept]
+        if sparse.issparse(self._W):
+            self._row_sums = self._row_sums[kept] - _row_sums(self._W[kept][:, removed])
+            self._W = self._W[kept][:, kept]
+        else:
+            kept_slots, removed_slots = self._slots[kept], self._slots[removed]
+            self._row_sums = self._row_sums[kept] - _row_sums(self._W[np.ix_(kept_slots, removed_slots)])
+            # unused rows and columns must be zero, see '_kernel_operator'
+            self._W[removed_slots] = 0
+            self._W[:, removed_slots] = 0
+            self._slots = kept_slots
+            self._free_slots = np.sort(np.concatenate((self._free_slots, removed_slots)))
+        if isinstance(self.data, np.ndarray):
+            self.data = self.data[kept]
+        else:
+            self.data = [self.data[i] for i in kept]
+        if self._tree is not None:
+            self._tree = cKDTree(self.data)
+        self._refresh_embedding(v0)
+
+
+# the data, kernels and output shared with the tasks run by '_run_kernel_tasks', set in each worker process by '_init_kernel_worker'
+_kernel_worker_state = {}
+# the number of rows evaluated at once by kernels providing a batched 'pairwise' method, bounding the size of their temporaries
+_pairwise_block_size = 512
+
+
+def _init_kernel_worker(data, kernels, W=None):
+    """Stores the state used by '_kernel_rows_task' and '_kernel_sum_task'. 'W' is either an array or a multiprocessing.RawArray in shared memory, which is viewed as a square array so that workers write their results directly into it."""
+    if W is not None and not isinstance(W, np.ndarray):
+        W = np.frombuffer(W).reshape(len(data), len(data))
+    _kernel_worker_state['data'] = data
+    _kernel_worker_state['kernels'] = kernels
+    _kernel_worker_state['W'] = W
+
+
+def _kernel_rows_task(args):
+    """Evaluates rows 'start' through 'stop' of the kernel matrix into the shared W. If 'symmetric', only the entries on and above the diagonal are evaluated and each row is mirrored into the corresponding column."""
+    start, stop, symmetric = args
+    data, kernel, W = _kernel_worker_state['data'], _kernel_worker_state['kernels'][0], _kernel_worker_state['W']
+    m = len(data)
+    if hasattr(kernel, 'pairwise'):
+        for block_start in xrange(start, stop, _pairwise_block_size):
+            block_stop = min(block_start + _pairwise_block_size, stop)
+            first_col = block_start if symmetric else 0
+            W[block_start:block_stop, first_col:] = kernel.pairwise(data[block_start:block_stop], data[first_col:])
+            if symmetric:
+                W[first_col:, block_start:block_stop] = W[block_start:block_stop, first_col:].T
+        return
+    for i in xrange(start, stop):
+        if symmetric:
+            for j in xrange(i, m):
+                W[i,j] = kernel(data[i], data[j])
+            W[i:,i] = W[i,i:]
+        else:
+            for j in xrange(m):
+                W[i,j] = kernel(data[i], data[j])
+
+
+def _kernel_sum_task(args):
+    """Returns the sum of rows 'start' through 'stop' of the kernel matrix of the kernel with index 'kernel_index'. If 'symmetric', entries above the diagonal are evaluated once and counted twice."""
+    kernel_index, start, stop, symmetric = args
+    data, kernel = _kernel_worker_state['data'], _kernel_worker_state['kernels'][kernel_index]
+    m = len(data)
+    w_sum = 0
+    if hasattr(kernel, 'pairwise'):
+        for block_start in xrange(start, stop, _pairwise_block_size):
+            block_stop = min(block_start + _pairwise_block_size, stop)
+            if symmetric:
+                # the first columns form the square block on the diagonal, every later column is mirrored below it
+                K = kernel.pairwise(data[block_start:block_stop], data[block_start:])
+                w_sum = w_sum + np.sum(K[:, :block_stop-block_start]) + 2*np.sum(K[:, block_stop-block_start:])
+            else:
+                w_sum = w_sum + np.sum(kernel.pairwise(data[block_start:block_stop], data))
+        return w_sum
+    for i in xrange(start, stop):
+        if symmetric:
+            w_sum = w_sum + kernel(data[i], data[i])
+            for j in xrange(i+1, m):
+                w_sum = w_sum + 2*kernel(data[i], data[j])
+        else:
+            for j in xrange(m):
+                w_sum = w_sum + kernel(data[i], data[j])
+    return w_sum
+
+
+def _row_tasks(m, workers):
+    """Splits the 'm' rows of the kernel matrix into (start, stop) ranges, several per worker so that the shorter rows of the upper triangle balance out across the pool"""
+    rows_per_task = max(1, m/(8*workers)) if workers > 1 else m
+    return [(start, min(start + rows_per_task, m)) for start in xrange(0, m, rows_per_task)]
+
+
+def _run_kernel_tasks(task, tasks, data, kernels, W=None, workers=None):
+    """Runs task(args) for each entry of 'tasks', either serially or, if 'workers' is greater than one, on a pool of 'workers' processes that share 'data', 'kernels' and 'W' through '_init_kernel_worker'.
+
+    .. note::
+        Worker processes are forked, so 'data' and 'kernels' are inherited rather than pickled and may be arbitrary callables, e.g. lambdas. Only the small task descriptions and results are sent between processes.
+
+    Returns:
+        results (list): the return values of 'task', in the order of 'tasks'
+    """
+    if workers is None or workers <= 1:
+        _init_kernel_worker(data, kernels, W)
+        try:
+            return [task(args) for args in tasks]
+        finally:
+            _kernel_worker_state.clear()
+    pool = multiprocessing.Pool(workers, _init_kernel_worker, (data, kernels, W))
+    try:
+        results = pool.map(task, tasks, chunksize=1)
+    finally:
+        pool.terminate()
+        pool.join()
+    return results
+
+
+def _custom_kernel_matrix(data, kernel, symmetric=False, workers=None):
+    """Evaluates the kernel matrix :math:`W_{ij} = k(x_i, x_j)` for an arbitrary Python 'kernel'. See 'embed_data_customkernel' for a description of the arguments.
+
+    Returns:
+        W (array): shape ("number of data points", "number of data points") array of kernel evaluations
     """
     # m is number of data pts, len should work in all cases
     m = len(data)
-    W = np.empty([m, m])
-    # first populate W with metrics
-    for i in xrange(m):
-        for j in xrange(m):
-            W[i,j] = kernel(data[i], data[j])
+    if workers is None or workers <= 1:
+        W = W_shared = np.empty([m, m])
+    else:
+        # workers write into shared memory, so no results are pickled back
+        W_shared = multiprocessing.RawArray('d', m*m)
+        W = np.frombuffer(W_shared).reshape(m, m)
+    tasks = [(start, stop, symmetric) for start, stop in _row_tasks(m, workers)]
+    _run_kernel_tasks(_kernel_rows_task, tasks, data, [kernel], W_shared, workers)
+    return W
+
+
+def embed_data_customkernel(data, k, kernel, symmetric=False, workers=None, solver='arpack', solver_options=None, stats=None):
+    """Computes the 'k'-dimensional DMAPS embedding of 'data' using the function 'kernel' to evaluate the DMAPS kernel between points and 'epsilon' as the characteristic radius of the neighborhood of each point. **Typically 'embed_data' should be used which employs the default exponential kernel with a potentially customized metric between points.**
+
+    Args:
+        data (iterable): typically a shape ("number of data points", "dimension of data") array containing the data as row vectors, but could be a list in which the :math:`i^{th}` entry contains :math:`i^{th}` data point, e.g. an adjacency matrix
+        kernel (function): the kernel to be used in conjunction with 'data', accepting calls like kernel(data[i], data[j]). If the kernel also provides a batched method kernel.pairwise(X, Y), as do those in 'dmaps_kernels', W is evaluated block by block with it instead.
+        k (int): number of dimensions to embed into
+        symmetric (bool): whether the kernel is symmetric, i.e. kernel(data[i], data[j]) == kernel(data[j], data[i]). If so, only the upper triangle of W is evaluated and the faster symmetric eigensolver is used.
+        workers (int): if greater than one, the kernel matrix is evaluated by a pool of 'workers' processes writing into shared memory
+        solver (string, function): the eigensolver, see 'embed_data'. Non-symmetric kernels require "arpack".
+        solver_options (dict): additional keyword arguments for 'solver'
+        stats (dmaps_profile.Stats): if given, records the time and memory taken by the "kernel", "normalization" and "eigensolve" stages
+
+    Returns:
+        eigvals (array): shape (k) vector with first 'k' eigenvectors of DMAPS embedding sorted from largest to smallest
+        eigvects (array): shape ("number of data points", k) array with the k-dimensional DMAPS-embedding eigenvectors. eigvects[:,i] corresponds to the eigenvector of the :math:`i^{th}`-largest eigenvalue, eigval[i].
+    """
+    with dmaps_profile.stage(stats, 'kernel'):
+        W = _custom_kernel_matrix(data, kernel, symmetric, workers)
 
     print 'finished constructing kernel matrix'
 
-    eigvals, eigvects = _compute_embedding(W, k, symmetric=symmetric)
+    eigvals, eigvects = _compute_embedding(W, k, symmetric=symmetric, solver=solver, solver_options=solver_options, stats=stats)
     return eigvals, eigvects
 
     
-def epsilon_plot(data, filename=False):
-    """Displays a logarithmic plot of :math:`L(\epsilon)` versus :math:`\epsilon` where :math:`L(\epsilon)` denotes the number of pairwise distances less than :math:`\epsilon`. Thus for small :math:`\epsilon`, :math:`L(\epsilon) \rightarrow n`, while large values of :math:`\epsilon` yield  :math:`L(\epsilon) \rightarrow n^2`. Reasonable :math:`\epsilon` values will fall in the linear range of this figure. Also plots the mean and median of the squared distances for comparison.
-    
+def epsilon_statistics(data, neps=20, metric=_l2_distance, nsamples=None, seed=None):
+    """Computes :math:`L(\epsilon)`, the number of ordered pairs of points (including each point with itself) closer than :math:`\epsilon`, over a logarithmic range of :math:`\epsilon` values, along with the mean and median of the pairwise distances. These are the quantities displayed by 'epsilon_plot'.
+
+    By default every pairwise distance is computed. If 'nsamples' is given, the statistics are instead estimated from the distances between 'nsamples' pairs of distinct points drawn uniformly at random, using O('nsamples') time and memory regardless of the size of 'data', and the standard error of each estimate is reported.
+
     Args:
         data (array): size (n, p) array where 'n' is the number of data points and 'p' is the dimension of each point
-        filename (bool): the filename to save the figure as. If left to default value of False, figure is not saved
+        neps (int): the number of :math:`\epsilon` values
+        metric (function, string): the distance measure, accepting calls like metric(data[i], data[j]), or a scipy metric name
+        nsamples (int): the number of random pairs to sample. If None, all pairs are used.
+        seed (int): seed for the random number generator used in sampling
+
+    Returns:
+        epsilons (array): shape (neps) vector of logarithmically spaced :math:`\epsilon` values, extending one decade beyond the smallest and largest nonzero distances
+        Ls (array): shape (neps) vector of :math:`L(\epsilon)` at each of 'epsilons'
+        mean (float): the mean pairwise distance
+        median (float): the median pairwise distance
+        errors (tuple): the standard errors (Ls_error, mean_error, median_error) of the estimates, with 'Ls_error' a shape (neps) vector. All are zero if every pair was used.
+
     >>> from test_dmaps import gen_swissroll
     >>> swissroll_data = gen_swissroll()
-    >>> epsilon_plot(swissroll_data)
+    >>> epsilons, Ls, mean, median, errors = epsilon_statistics(swissroll_data, nsamples=10**5)
     """
     n = data.shape[0]
-    # calculate pairwise distances and sort
-    sorted_dists = np.sort(pdist(data, 'euclidean'))
-    # find maximum and minimum distances
-    logeps_min = np.floor(np.log10(sorted_dists[0])).astype(int)
+    # number of distances, "n choose 2"
+    ndists = n*(n-1)/2
+    if nsamples is None:
+        sorted_dists = np.sort(pdist(data, 'euclidean' if metric is _l2_distance else metric))
+    else:
+        random_state = np.random.RandomState(seed)
+        sorted_dists = np.empty(nsamples)
+        # sample in chunks to bound the memory used by the sampled pairs' coordinates
+        chunk_size = 10**5
+        for start in xrange(0, nsamples, chunk_size):
+            stop = min(start + chunk_size, nsamples)
+            i = random_state.randint(0, n, stop - start)
+            # draw j uniformly from the other n - 1 points
+            j = random_state.randint(0, n - 1, stop - start)
+            j[j >= i] += 1
+            sorted_dists[start:stop] = _paired_distances(np.asarray(data[i]), np.asarray(data[j]), metric)
+        sorted_dists.sort()
+    nsorted = sorted_dists.shape[0]
+    # find minimum nonzero and maximum distances
+    logeps_min = np.floor(np.log10(sorted_dists[np.searchsorted(sorted_dists, 0, side='right')])).astype(int)
     logeps_max = np.ceil(np.log10(sorted_dists[-1])).astype(int)
     # make epsilon values of interest
-    neps = 20
-    Ls = n*np.ones(neps)
-    logepss = np.logspace(logeps_min - 1, logeps_max + 1, neps)
-    current_index = 0
-    for i, eps in enumerate(logepss):
-        while current_index < sorted_dists.shape[0] and sorted_dists[current_index] < eps:
-            current_index += 1
-        Ls[i] += 2*current_index
+    epsilons = np.logspace(logeps_min - 1, logeps_max + 1, neps)
+    # fraction of distances below each epsilon
+    fractions = np.searchsorted(sorted_dists, epsilons, side='left')/float(nsorted)
+    # each point is within any epsilon of itself, every distance is counted twice
+    Ls = n + 2*ndists*fractions
     median = np.median(sorted_dists)
     mean = np.average(sorted_dists)
+    if nsamples is None:
+        errors = (np.zeros(neps), 0.0, 0.0)
+    else:
+        Ls_error = 2*ndists*np.sqrt(fractions*(1 - fractions)/nsorted)
+        mean_error = np.std(sorted_dists)/np.sqrt(nsorted)
+        # the order statistics one standard deviation of the binomial count on either side of the median bracket it
+        spread = int(np.ceil(np.sqrt(nsorted)/2))
+        median_error = (sorted_dists[min(nsorted/2 + spread, nsorted - 1)] - sorted_dists[max(nsorted/2 - spread, 0)])/2
+        errors = (Ls_error, mean_error, median_error)
+    return epsilons, Ls, mean, median, errors
+
+
+def epsilon_plot(data, filename=False, nsamples=None):
+    """Displays a logarithmic plot of :math:`L(\epsilon)` versus :math:`\epsilon` where :math:`L(\epsilon)` denotes the number of pairwise distances less than :math:`\epsilon`. Thus for small :math:`\epsilon`, :math:`L(\epsilon) \rightarrow n`, while large values of :math:`\epsilon` yield  :math:`L(\epsilon) \rightarrow n^2`. Reasonable :math:`\epsilon` values will fall in the linear range of this figure. Also plots the mean and median of the squared distances for comparison.
+    
+    Args:
+        data (array): size (n, p) array where 'n' is the number of data points and 'p' is the dimension of each point
+        filename (bool): the filename to save the figure as. If left to default value of False, figure is not saved
+        nsamples (int): if given, the curve is estimated from this many random pairs of points rather than from every pair, see 'epsilon_statistics'
+    >>> from test_dmaps import gen_swissroll
+    >>> swissroll_data = gen_swissroll()
+    >>> epsilon_plot(swissroll_data)
+    """
+    logepss, Ls, mean, median, errors = epsilon_statistics(data, nsamples=nsamples)
     # plot results
     import matplotlib.pyplot as plt
     fig = plt.figure()
     ax = fig.add_subplot(111)
     ax.plot(logepss, Ls)
+    if nsamples is not None:
+        ax.fill_between(logepss, Ls - 2*errors[0], Ls + 2*errors[0], alpha=0.3)
     ax.set_xscale('log')
     ax.set_yscale('log')
     ax.axvline(x=mean, c='r', label=r'$\epsilon_{mean}$')
@@ -192,14 +1275,16 @@ def epsilon_plot(data, filename=False):
     plt.show(fig)
 
 
-def kernel_plot(kernels, params, data, filename=False):
+def kernel_plot(kernels, params, data, filename=False, symmetric=False, workers=None):
     """Displays a logarithmic plot of :math:`\sum_{i,j} W_{ij}(\epsilon)` versus :math:`\epsilon` over the range of epsilons provided as the first argument. Reasonable :math:`\epsilon` values will fall in the linear range of this figure. Also plots the mean and median of the squared distances for comparison.
     
     Args:
-        kernels (list): kernel functions used to calculate :math:`W_{ij} = k(pt_i, pt_j)`. Typically there should be some :math:`\epsilon` parameter in the kernel function that varies over many orders of magnitude.
+        kernels (list): kernel functions used to calculate :math:`W_{ij} = k(pt_i, pt_j)`. Typically there should be some :math:`\epsilon` parameter in the kernel function that varies over many orders of magnitude. Kernels providing a batched 'pairwise' method are evaluated block by block with it.
         params (array): vector of length 'nkernels' containing the different values of the parameter of interest used to create the different 'kernels'. Typically a vector of :math:`\epsilon` values.
         data (array): size (n, p) array where 'n' is the number of data points and 'p' is the dimension of each point
         filename (bool): the filename to save the figure as. If left to default value of False, figure is not saved
+        symmetric (bool): whether the 'kernels' are symmetric, in which case only the upper triangle of each kernel matrix is evaluated
+        workers (int): if greater than one, the sums are evaluated by a pool of 'workers' processes
 
     >>> from test_dmaps import gen_swissroll
     >>> swissroll_data = gen_swissroll()
@@ -210,14 +1295,11 @@ def kernel_plot(kernels, params, data, filename=False):
     import matplotlib.pyplot as plt
     n = len(data) # data.shape[0]
     nkernels = len(kernels)
-    w_sums = np.empty((nkernels))
-    # loop over epsilons and calculate sum at each value
-    for k, kernel in enumerate(kernels):
-        w_sum = 0
-        for i in xrange(n):
-            for j in xrange(n):
-                w_sum = w_sum + kernel(data[i], data[j])
-        w_sums[k] = w_sum
+    w_sums = np.zeros((nkernels))
+    # loop over epsilons and calculate sum at each value, split into row ranges
+    tasks = [(k, start, stop, symmetric) for k in xrange(nkernels) for start, stop in _row_tasks(n, workers)]
+    for (k, start, stop, _), w_sum in zip(tasks, _run_kernel_tasks(_kernel_sum_task, tasks, data, kernels, workers=workers)):
+        w_sums[k] += w_sum
     # plot results
     fig = plt.figure()
     ax = fig.add_subplot(111)
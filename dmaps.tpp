@@ -3,15 +3,28 @@
 namespace dmaps {
 
 
+  /// returns the data point at index 'i' of a vector of data points
   template <typename T>
-  int map(const std::vector<T>& input_data, const Kernel_Function& kernel_fn, Vector& eigvals, Matrix& eigvects, Matrix& W, const int k, const double weight_threshold) {
+  const T& _point(const std::vector<T>& input_data, const int i) {
+    return input_data[i];
+  }
 
+
+  /// returns the data point at index 'i' of a matrix of data points, i.e. its 'i'th row, without copying it
+  template <typename Derived>
+  typename Eigen::MatrixBase<Derived>::ConstRowXpr _point(const Eigen::MatrixBase<Derived>& input_data, const int i) {
+    return input_data.row(i);
+  }
+
+
+  /// evaluates the 'ndata' by 'ndata' kernel matrix 'W' of 'input_data', zeroing entries below 'weight_threshold'
+  template <typename Data>
+  void _kernel_matrix(const Data& input_data, const int ndata, const Kernel_Function& kernel_fn, Matrix& W, const double weight_threshold) {
     // calculate W entries
-    int ndata = input_data.size();
     W = Matrix(ndata, ndata);
     for(int i = 0; i < ndata; i++) {
       for(int j = 0; j < ndata; j++) {
-	W(i,j) = kernel_fn(input_data[i], input_data[j]);
+	W(i,j) = kernel_fn(_point(input_data, i), _point(input_data, j));
       }
     }
     // ? for vectorization ?
@@ -22,20 +35,45 @@ namespace dmaps {
 	}
       }
     }
+  }
 
+
+  /// normalizes 'W' and computes its partial eigendecomposition, writing the eigenpairs into 'eigvals' and 'eigvects', which may be resizable Eigen objects or fixed views such as Eigen::Ref
+  template <typename Vector_Out, typename Matrix_Out>
+  int _embed(const Matrix& W, Vector_Out& eigvals, Matrix_Out& eigvects, const int k) {
+    const int ndata = W.rows();
     // calculate row-stochastic matrix, calculate partial eigendecomp
-    // normalize W to make symmetric
-    Matrix D_half_inv = W.rowwise().sum().array().pow(-0.5).matrix().asDiagonal();
-    Matrix S = D_half_inv*W*D_half_inv;
+    // normalize W to make symmetric, keeping D^{-1/2} as a vector rather than a dense diagonal matrix
+    Vector D_half_inv = W.rowwise().sum().array().pow(-0.5).matrix();
+    Matrix S = D_half_inv.asDiagonal()*W*D_half_inv.asDiagonal();
     Matrix V_ritz;
     Vector l_ritz;
     const int iram_maxiter=10*ndata, qr_maxiter=20*ndata;
     const int iram_success = eigen_solver::arnoldi_method_imprestart_hermitian(S, Vector::Ones(ndata), V_ritz, l_ritz, k, 2*k, iram_maxiter, qr_maxiter);
-    eigvects = D_half_inv*V_ritz;
-    eigvals = l_ritz;
+    // the solver may return more than 'k' Ritz pairs, of which the first 'k' are wanted, or fewer if it failed
+    if(V_ritz.cols() < k || l_ritz.size() < k) {
+      return 1;
+    }
+    eigvects = D_half_inv.asDiagonal()*V_ritz.leftCols(k);
+    eigvals = l_ritz.head(k);
     return iram_success == 1;
   }
-    
+
+
+  template <typename T>
+  int map(const std::vector<T>& input_data, const Kernel_Function& kernel_fn, Vector& eigvals, Matrix& eigvects, Matrix& W, const int k, const double weight_threshold) {
+    _kernel_matrix(input_data, input_data.size(), kernel_fn, W, weight_threshold);
+    return _embed(W, eigvals, eigvects, k);
+  }
+
+
+  template <typename Derived>
+  int map(const Eigen::MatrixBase<Derived>& input_data, const Kernel_Function& kernel_fn, Eigen::Ref<Vector> eigvals, Eigen::Ref<Matrix> eigvects, const int k, const double weight_threshold) {
+    Matrix W;
+    _kernel_matrix(input_data, input_data.rows(), kernel_fn, W, weight_threshold);
+    return _embed(W, eigvals, eigvects, k);
+  }
+
 
   template <typename T>
   int map(const std::vector< T > &input_data, const Kernel_Function& kernel_fn, std::vector<double>& eigvals, std::vector< std::vector<double> >& eigvects, std::vector< std::vector<double> >& W, const int k, const double weight_threshold) {
@@ -87,9 +125,9 @@ namespace dmaps {
   }
 
 
-  template <typename T>
-  std::vector<double> test_kernels(const std::vector<T>& input_data, const std::vector<Kernel_Function>& kernel_fns) {
-    const int npts = input_data.size();
+  /// calculates the sum of the entries of the kernel matrix of the 'npts' points in 'input_data' for each of 'kernel_fns'
+  template <typename Data>
+  std::vector<double> _test_kernels(const Data& input_data, const int npts, const std::vector<Kernel_Function>& kernel_fns) {
     const int nkernels = kernel_fns.size();
     std::vector<double> w_sums(nkernels, 0);
     int sum_count = 0;
@@ -98,14 +136,14 @@ namespace dmaps {
       // add up off-diagonal entries in upper right of matrix
       for(int i = 0; i < npts; i++) {
   	for(int j = i+1; j < npts; j++) {
-  	  w_sums[sum_count] += kernel(input_data[i], input_data[j]);
+  	  w_sums[sum_count] += kernel(_point(input_data, i), _point(input_data, j));
   	}
       }
       // double to include off-diagonal in lower left
       w_sums[sum_count] *= 2;
       // finally, include diagonal elements
       for(int i = 0; i < npts; i++) {
-	w_sums[sum_count] += kernel(input_data[i], input_data[i]);
+	w_sums[sum_count] += kernel(_point(input_data, i), _point(input_data, i));
       }
       sum_count++;
     }
@@ -113,4 +151,16 @@ namespace dmaps {
   }
 
 
+  template <typename T>
+  std::vector<double> test_kernels(const std::vector<T>& input_data, const std::vector<Kernel_Function>& kernel_fns) {
+    return _test_kernels(input_data, input_data.size(), kernel_fns);
+  }
+
+
+  template <typename Derived>
+  std::vector<double> test_kernels(const Eigen::MatrixBase<Derived>& input_data, const std::vector<Kernel_Function>& kernel_fns) {
+    return _test_kernels(input_data, input_data.rows(), kernel_fns);
+  }
+
+
 }
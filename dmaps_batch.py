@@ -0,0 +1,139 @@
+"""Runs many independent DMAPS embeddings concurrently on a pool of worker processes, e.g. the embeddings of a parameter-space scan with the kernels of 'dmaps_kernels'
+
+Each job is a dictionary holding the 'data' and number of eigenpairs 'k' of one embedding, along with either
+
+    - 'kernel': a custom kernel, embedded with 'dmaps.embed_data_customkernel', with the optional entries 'symmetric', 'solver' and 'solver_options'
+    - any other keyword arguments of 'dmaps.embed_data', e.g. 'epsilon', 'metric' or 'n_neighbors'
+
+and optionally an 'id' returned with its result. Each worker limits its BLAS library to a few threads, so that the pool as a whole uses every core without oversubscribing them, and results are yielded as soon as each job finishes.
+
+>>> jobs = [{'id': epsilon, 'data': data, 'k': 6, 'epsilon': epsilon} for epsilon in np.logspace(-1, 1, 20)]
+>>> for result in dmaps_batch.run_jobs(jobs):
+...     print result['id'], result['eigvals']
+
+"""
+
+import ctypes
+import multiprocessing
+import os
+import time
+import traceback
+import warnings
+import dmaps
+
+# the environment variables read by common BLAS and OpenMP implementations when they are loaded
+_blas_thread_variables = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'BLIS_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS')
+# functions setting the thread count of BLAS libraries already loaded in the process, by library name
+_blas_thread_setters = {'openblas': 'openblas_set_num_threads', 'mkl_rt': 'MKL_Set_Num_Threads', 'blis': 'bli_thread_set_num_threads'}
+# the jobs run by '_run_job', set in each worker process by '_init_batch_worker'
+_batch_jobs = []
+# the limits held by threadpoolctl, if available, which apply for as long as they are referenced
+_thread_limits = None
+
+
+def _loaded_libraries():
+    """Returns the paths of the shared libraries loaded in this process, as listed in /proc/self/maps, or an empty list where that is unavailable"""
+    try:
+        with open('/proc/self/maps') as maps:
+            return sorted(set(line.split()[-1] for line in maps if '.so' in line))
+    except IOError:
+        return []
+
+
+def limit_blas_threads(threads):
+    """Limits the number of threads used by BLAS in this process to 'threads'. Libraries already loaded are limited through threadpoolctl if it is installed, or else by calling their thread count setters directly, while the environment variables read by libraries loaded later are set as well.
+
+    Args:
+        threads (int): the number of threads
+
+    Returns:
+        limited (bool): whether the threads of any loaded library were limited. If not, e.g. when the BLAS library in use is not recognized, only the libraries loaded later are limited.
+    """
+    global _thread_limits
+    for variable in _blas_thread_variables:
+        os.environ[variable] = str(threads)
+    try:
+        import threadpoolctl
+        _thread_limits = threadpoolctl.threadpool_limits(threads)
+        return len(threadpoolctl.threadpool_info()) > 0
+    except ImportError:
+        pass
+    limited = False
+    for path in _loaded_libraries():
+        for name, setter in _blas_thread_setters.items():
+            if name in os.path.basename(path):
+                try:
+                    getattr(ctypes.CDLL(path), setter)(threads)
+                    limited = True
+                except (OSError, AttributeError):
+                    pass
+    return limited
+
+
+def _init_batch_worker(jobs, blas_threads, warned):
+    """Stores the jobs run by '_run_job' and limits the BLAS threads of the worker, warning once per pool, through the shared flag 'warned', if no loaded library could be limited"""
+    global _batch_jobs
+    _batch_jobs = jobs
+    if blas_threads is not None and not limit_blas_threads(blas_threads):
+        with warned.get_lock():
+            if not warned.value:
+                warned.value = True
+                warnings.warn('could not limit the threads of the loaded BLAS library to %d, so the workers may oversubscribe the cores; install threadpoolctl or set OMP_NUM_THREADS before starting Python' % blas_threads)
+
+
+def _run_job(index):
+    """Embeds the job at 'index' of '_batch_jobs'
+
+    Returns:
+        result (dict): the job's 'index' and 'id', the embedding's 'eigvals' and 'eigvects', the 'wall' time taken and, if the job raised an exception, its formatted traceback as 'error' with 'eigvals' and 'eigvects' None
+    """
+    job = dict(_batch_jobs[index])
+    result = {'index': index, 'id': job.pop('id', None), 'eigvals': None, 'eigvects': None, 'error': None}
+    start = time.time()
+    try:
+        data, k = job.pop('data'), job.pop('k')
+        if 'kernel' in job:
+            result['eigvals'], result['eigvects'] = dmaps.embed_data_customkernel(data, k, job.pop('kernel'), **job)
+        else:
+            result['eigvals'], result['eigvects'] = dmaps.embed_data(data, k, **job)
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['wall'] = time.time() - start
+    return result
+
+
+def run_jobs(jobs, workers=None, blas_threads=None):
+    """Runs each of 'jobs' on a pool of worker processes, yielding their results in the order they finish
+
+    .. note::
+        Worker processes are forked, so the jobs are inherited rather than pickled and their kernels may be arbitrary callables, e.g. lambdas. Only the job indices and the results are sent between processes.
+
+    Args:
+        jobs (list): job dictionaries, see the module documentation
+        workers (int): the number of worker processes. If None, one per core. If one, the jobs are run in this process instead.
+        blas_threads (int): the number of BLAS threads of each worker. If None, the cores are divided evenly between the workers.
+
+    Yields:
+        result (dict): the result of one job, see '_run_job'
+    """
+    global _batch_jobs
+    cores = multiprocessing.cpu_count()
+    if workers is None:
+        workers = min(cores, len(jobs))
+    if blas_threads is None:
+        blas_threads = max(1, cores/max(workers, 1))
+    if workers <= 1:
+        _batch_jobs = jobs
+        try:
+            for index in xrange(len(jobs)):
+                yield _run_job(index)
+        finally:
+            _batch_jobs = []
+        return
+    pool = multiprocessing.Pool(workers, _init_batch_worker, (jobs, blas_threads, multiprocessing.Value('b', False)))
+    try:
+        for result in pool.imap_unordered(_run_job, xrange(len(jobs))):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
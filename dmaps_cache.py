@@ -0,0 +1,132 @@
+"""A persistent on-disk cache for the intermediate results of DMAPS embeddings (distance matrices, kernel matrices and eigenpairs), used through the 'cache' argument of 'dmaps.embed_data'
+
+Entries are content-addressed: their keys hash the data together with the parameters that produced them, so a rerun with identical inputs finds the stored result however it was called. Arrays are stored in NumPy's binary .npy format and memory-mapped when reloaded, and the least recently used entries are evicted once the cache grows beyond its size limit.
+
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import numpy as np
+import scipy.sparse as sparse
+
+def fingerprint(data):
+    """Computes a digest identifying the contents of 'data'
+
+    Args:
+        data (iterable): an array, whose shape, type and raw bytes are hashed, or any picklable collection of data points
+
+    Returns:
+        digest (str): hex digest of the contents of 'data'
+    """
+    digest = hashlib.sha1()
+    if isinstance(data, np.ndarray):
+        data = np.ascontiguousarray(data)
+        digest.update(repr((data.dtype.str, data.shape)))
+        digest.update(data.data)
+    else:
+        digest.update(pickle.dumps(data, 2))
+    return digest.hexdigest()
+
+def callable_name(fn):
+    """Returns a name identifying the function 'fn' across runs, or None if it has none, e.g. because it is a lambda or is defined inside another function. Strings, such as scipy metric names, identify themselves."""
+    if isinstance(fn, str):
+        return fn
+    name = getattr(fn, '__name__', None)
+    module = sys.modules.get(getattr(fn, '__module__', None))
+    if module is None or getattr(module, name, None) is not fn:
+        return None
+    return fn.__module__ + '.' + name
+
+class Cache:
+    """A directory of cached arrays with least-recently-used eviction
+
+    Dense arrays are stored as .npy files and returned as read-only memory maps, so that reloading a large kernel matrix costs no more memory than the pages actually read. Sparse matrices and tuples of arrays (e.g. eigenpairs) are stored as .npz archives.
+
+    Attributes:
+        directory (str): the directory holding the cache entries
+        max_bytes (int): the size beyond which the least recently used entries are deleted
+
+    >>> cache = Cache('./dmaps_cache', max_bytes=2**32)
+    >>> eigvals, eigvects = dmaps.embed_data(data, k, epsilon=2.5, cache=cache)
+    >>> # only the eigendecomposition is recomputed
+    >>> eigvals, eigvects = dmaps.embed_data(data, 2*k, epsilon=2.5, cache=cache)
+    """
+
+    def __init__(self, directory, max_bytes=2**32):
+        """Sets directory and max_bytes, creating 'directory' if needed"""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, *parts):
+        """Returns the key of the entry identified by 'parts', which may be any values with a deterministic repr, e.g. strings, numbers, None or other keys"""
+        return hashlib.sha1(repr(parts)).hexdigest()
+
+    def _path(self, key, extension):
+        return os.path.join(self.directory, key + extension)
+
+    def load(self, key):
+        """Returns the value stored under 'key', or None if there is no such entry, and marks the entry as recently used"""
+        path = self._path(key, '.npy')
+        if os.path.exists(path):
+            os.utime(path, None)
+            return np.load(path, mmap_mode='r')
+        path = self._path(key, '.npz')
+        if os.path.exists(path):
+            os.utime(path, None)
+            archive = np.load(path)
+            try:
+                if 'csr_data' in archive.files:
+                    return sparse.csr_matrix((archive['csr_data'], archive['csr_indices'], archive['csr_indptr']), shape=tuple(archive['csr_shape']))
+                return tuple(archive['item_%d' % i] for i in xrange(len(archive.files)))
+            finally:
+                archive.close()
+        return None
+
+    def save(self, key, value):
+        """Stores 'value', either an array, a scipy.sparse matrix or a tuple of arrays, under 'key' and evicts old entries if the cache has grown too large"""
+        if isinstance(value, np.ndarray):
+            extension = '.npy'
+        else:
+            extension = '.npz'
+        # write to a temporary file first so that readers never see a partial entry
+        output = tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False)
+        try:
+            if isinstance(value, np.ndarray):
+                np.save(output, value)
+            elif sparse.issparse(value):
+                value = value.tocsr()
+                np.savez(output, csr_data=value.data, csr_indices=value.indices, csr_indptr=value.indptr, csr_shape=np.array(value.shape))
+            else:
+                np.savez(output, **dict(('item_%d' % i, item) for i, item in enumerate(value)))
+        finally:
+            output.close()
+        path = self._path(key, extension)
+        os.rename(output.name, path)
+        self._evict(keep=path)
+
+    def _evict(self, keep=None):
+        """Deletes the least recently used entries, other than 'keep', until the cache is no larger than 'max_bytes'"""
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.npy') or filename.endswith('.npz'):
+                path = os.path.join(self.directory, filename)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                os.remove(path)
+                total -= size
+
+    def clear(self):
+        """Deletes every entry in the cache"""
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.npy') or filename.endswith('.npz'):
+                os.remove(os.path.join(self.directory, filename))
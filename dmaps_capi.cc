@@ -0,0 +1,67 @@
+#include <algorithm>
+#include <exception>
+#include <vector>
+#include <Eigen/Dense>
+#include "gaussian_kernel.h"
+#include "dmaps.h"
+
+/**
+ * C interface to 'dmaps::map' and 'dmaps::test_kernels' with the Gaussian kernel, built as the shared library 'libdmaps.so' and loaded from Python by 'dmaps_native.py'. All arrays are owned by the caller and are viewed through Eigen::Map, so neither the data nor the eigenpairs are copied between the caller's buffers and the DMAPS engine.
+ */
+
+extern "C" {
+
+  /**
+   * Performs DMAP with the Gaussian kernel on 'npts' points of dimension 'dim'
+   *
+   * \param data row-major (npts, dim) array in which each row is a data point
+   * \param npts number of data points
+   * \param dim dimension of each data point
+   * \param epsilon DMAPS parameter of the Gaussian kernel
+   * \param k dimension of embedding to compute
+   * \param weight_threshold threshold below which entries of W are set to zero
+   * \param eigvals output array of size 'k' for the eigenvalues
+   * \param eigvects output array of size 'k'*'npts' in which the eigenvectors are stored one after another, i.e. a row-major (k, npts) array
+   * \returns 0 on success, 1 if the eigensolver failed and 2 if an exception was raised
+   */
+  int dmaps_map(const double* data, const int npts, const int dim, const double epsilon, const int k, const double weight_threshold, double* eigvals, double* eigvects) {
+    try {
+      Eigen::Map<const Row_Matrix> input_data(data, npts, dim);
+      Eigen::Map<Vector> eigvals_out(eigvals, k);
+      // column-major (npts, k) is the same memory as row-major (k, npts)
+      Eigen::Map<Matrix> eigvects_out(eigvects, npts, k);
+      return dmaps::map(input_data, Kernel_Function(epsilon), eigvals_out, eigvects_out, k, weight_threshold);
+    }
+    catch(const std::exception& e) {
+      return 2;
+    }
+  }
+
+  /**
+   * Calculates \f$\sum_i \sum_j W_{ij}\f$ of the Gaussian kernel for each of 'nkernels' values of epsilon
+   *
+   * \param data row-major (npts, dim) array in which each row is a data point
+   * \param npts number of data points
+   * \param dim dimension of each data point
+   * \param epsilons array of 'nkernels' values of the DMAPS parameter
+   * \param nkernels number of kernels to test
+   * \param w_sums output array of size 'nkernels' for the sums
+   * \returns 0 on success and 2 if an exception was raised
+   */
+  int dmaps_test_kernels(const double* data, const int npts, const int dim, const double* epsilons, const int nkernels, double* w_sums) {
+    try {
+      Eigen::Map<const Row_Matrix> input_data(data, npts, dim);
+      std::vector<Kernel_Function> kernels;
+      for(int i = 0; i < nkernels; i++) {
+	kernels.push_back(Kernel_Function(epsilons[i]));
+      }
+      std::vector<double> sums = dmaps::test_kernels(input_data, kernels);
+      std::copy(sums.begin(), sums.end(), w_sums);
+      return 0;
+    }
+    catch(const std::exception& e) {
+      return 2;
+    }
+  }
+
+}
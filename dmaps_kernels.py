@@ -6,6 +6,15 @@
 
 import numpy as np
 
+def _squared_distances(X, Y):
+    """Returns the shape (len(X), len(Y)) array of squared euclidean distances between the rows of 'X' and 'Y', computed with a single matrix product"""
+    D = np.dot(X, Y.T)
+    D *= -2
+    D += np.sum(X*X, 1)[:, np.newaxis]
+    D += np.sum(Y*Y, 1)
+    # roundoff may leave slightly negative values between (nearly) coincident points
+    return np.maximum(D, 0, out=D)
+
 class objective_function_kernel:
     """A single-function class used to evaluate the modified DMAPS kernel between two points as motivated by Lafone's thesis. That is :math:`W_{ij}=exp(\\frac{\|x_i - x_j\|^2}{\epsilon} - \\frac{(of(x_i) - of(x_j))^2}{\epsilon^2})`
 
@@ -29,6 +38,22 @@ class objective_function_kernel:
         """
         return np.exp(-np.power(np.linalg.norm(pt1[:-1] - pt2[:-1]), 2)/self._epsilon - np.power(pt1[-1] - pt2[-1], 2)/np.power(self._epsilon, 2))
 
+    def pairwise(self, X, Y):
+        """Evaluates the kernel between every point in 'X' and every point in 'Y' at once, so that pairs are processed with array operations instead of one '__call__' at a time
+
+        Args:
+            X (array): shape (n, p+1) array of points, each laid out as in '__call__'
+            Y (array): shape (l, p+1) array of points
+
+        Returns:
+            W (array): shape (n, l) array in which W[i,j] is the kernel evaluation between X[i] and Y[j]
+        """
+        X = np.asarray(X, dtype=float); Y = np.asarray(Y, dtype=float)
+        W = _squared_distances(X[:,:-1], Y[:,:-1])
+        W /= -self._epsilon
+        W -= np.power(np.subtract.outer(X[:,-1], Y[:,-1])/self._epsilon, 2)
+        return np.exp(W, out=W)
+
 class gradient_kernel:
     """A single-function class used to evaluate the modified DMAPS kernel between two points as **defined** by Lafone's thesis. That is :math:`W_{ij}=exp(\\frac{\|x_i - x_j\|^2}{\epsilon} - \\frac{(<\nabla f_{x_i}, x_i-x_j>)^2}{\epsilon^2})`
 
@@ -53,6 +78,25 @@ class gradient_kernel:
         """
         return np.exp(-np.power(np.linalg.norm(pt1 - pt2), 2)/self._epsilon - np.power(np.dot(self._gradient(pt1), pt1 - pt2)/self._epsilon, 2))
 
+    def pairwise(self, X, Y):
+        """Evaluates the kernel between every point in 'X' and every point in 'Y' at once. The gradient is evaluated once for each point of 'X' rather than once for each pair.
+
+        Args:
+            X (array): shape (n, p) array of points
+            Y (array): shape (l, p) array of points
+
+        Returns:
+            W (array): shape (n, l) array in which W[i,j] is the kernel evaluation between X[i] and Y[j]
+        """
+        X = np.asarray(X, dtype=float); Y = np.asarray(Y, dtype=float)
+        gradients = np.array([self._gradient(x) for x in X])
+        # <grad f(x_i), x_i - y_j> = <grad f(x_i), x_i> - <grad f(x_i), y_j>
+        projections = np.sum(gradients*X, 1)[:, np.newaxis] - np.dot(gradients, Y.T)
+        W = _squared_distances(X, Y)
+        W /= -self._epsilon
+        W -= np.power(projections/self._epsilon, 2)
+        return np.exp(W, out=W)
+
 class Data_Kernel:
     """Computes kernel between two points in parameter space, taking into account both the euclidean distance between parameters and the euclidean distance between model predictions at those parameters"""
     def __init__(self, epsilon, lam):
@@ -67,3 +111,20 @@ class Data_Kernel:
             x2 (array): second data point in which x = [(parameters), (predictions)]
         """
         return np.exp(-(np.power(np.linalg.norm(x1[0] - x2[0])/self._epsilon,2) + np.power(np.linalg.norm(x1[1] - x2[1])/self._lam, 2)))
+
+    def pairwise(self, X, Y):
+        """Evaluates the kernel between every point in 'X' and every point in 'Y' at once
+
+        Args:
+            X (list): 'n' data points, each laid out as in '__call__'
+            Y (list): 'l' data points, each laid out as in '__call__'
+
+        Returns:
+            W (array): shape (n, l) array in which W[i,j] is the kernel evaluation between X[i] and Y[j]
+        """
+        X_params = np.array([np.ravel(x[0]) for x in X], dtype=float); Y_params = np.array([np.ravel(y[0]) for y in Y], dtype=float)
+        X_predictions = np.array([np.ravel(x[1]) for x in X], dtype=float); Y_predictions = np.array([np.ravel(y[1]) for y in Y], dtype=float)
+        W = _squared_distances(X_params, Y_params)
+        W /= -self._epsilon*self._epsilon
+        W -= _squared_distances(X_predictions, Y_predictions)/(self._lam*self._lam)
+        return np.exp(W, out=W)
@@ -0,0 +1,93 @@
+"""Bindings to the C++ implementation of DMAPS ('dmaps::map' and 'dmaps::test_kernels' with the Gaussian kernel), loaded with ctypes from the shared library built by
+
+    make libdmaps.so
+
+The library is looked for in the path given by the environment variable DMAPS_NATIVE_LIB, then next to this module. NumPy arrays are passed to the library by pointer and viewed in place through Eigen::Map, so C-contiguous double precision data is not copied, and the eigenpairs are written directly into arrays allocated here.
+
+"""
+
+import ctypes
+import os
+import numpy as np
+from numpy.ctypeslib import ndpointer
+
+# the loaded library, see '_library'
+_lib = None
+
+def _library():
+    """Loads the shared library on first use, declaring the argument types of its functions
+
+    Returns:
+        lib (ctypes.CDLL): the loaded library
+
+    Raises:
+        OSError: if the library cannot be found or loaded
+    """
+    global _lib
+    if _lib is None:
+        path = os.environ.get('DMAPS_NATIVE_LIB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'libdmaps.so'))
+        lib = ctypes.CDLL(path)
+        doubles = ndpointer(np.float64, flags='C_CONTIGUOUS')
+        lib.dmaps_map.argtypes = [doubles, ctypes.c_int, ctypes.c_int, ctypes.c_double, ctypes.c_int, ctypes.c_double, doubles, doubles]
+        lib.dmaps_map.restype = ctypes.c_int
+        lib.dmaps_test_kernels.argtypes = [doubles, ctypes.c_int, ctypes.c_int, doubles, ctypes.c_int, doubles]
+        lib.dmaps_test_kernels.restype = ctypes.c_int
+        _lib = lib
+    return _lib
+
+def available():
+    """Returns whether the shared library can be loaded"""
+    try:
+        _library()
+    except OSError:
+        return False
+    return True
+
+def map(data, k, epsilon, weight_threshold=0):
+    """Computes the 'k'-dimensional DMAPS embedding of 'data' with the kernel :math:`W_{ij} = e^{-\|x_i - x_j\|^2/\epsilon^2}` in C++, as 'dmaps.embed_data' does with its default metric
+
+    Args:
+        data (array): shape ("number of data points", "dimension of data") array containing the data as row vectors. Passed without copying if it is a C-contiguous array of doubles.
+        k (int): number of dimensions to embed into
+        epsilon (float): the characteristic radius of the neighborhood of each point
+        weight_threshold (float): entries of W below this value are set to zero
+
+    Returns:
+        eigvals (array): shape (k) vector with first 'k' eigenvalues of DMAPS embedding sorted from largest to smallest magnitude
+        eigvects (array): shape ("number of data points", k) array with the corresponding eigenvectors, each scaled to norm one
+
+    Raises:
+        RuntimeError: if the eigensolver fails or the library raises an exception
+    """
+    data = np.ascontiguousarray(data, dtype=np.float64)
+    npts, dim = data.shape
+    eigvals = np.empty(k)
+    # the library fills a column-major (npts, k) matrix, i.e. one eigenvector per row of this array
+    eigvects = np.empty((k, npts))
+    status = _library().dmaps_map(data, npts, dim, epsilon, k, weight_threshold, eigvals, eigvects)
+    if status != 0:
+        raise RuntimeError('dmaps_map failed with status ' + str(status))
+    # sort eigvals and corresponding eigvects from largest to smallest magnitude, as '_normalized_eigenpairs' does
+    sorted_indices = np.argsort(np.abs(eigvals))[::-1]
+    eigvects = eigvects[sorted_indices].T
+    eigvects /= np.linalg.norm(eigvects, axis=0)
+    return eigvals[sorted_indices], eigvects
+
+def test_kernels(data, epsilons):
+    """Computes :math:`\sum_i \sum_j W_{ij}` of the Gaussian kernel for each of 'epsilons' in C++, without storing W
+
+    Args:
+        data (array): shape ("number of data points", "dimension of data") array containing the data as row vectors
+        epsilons (array): values of epsilon to test
+
+    Returns:
+        w_sums (array): shape (len(epsilons)) vector of the sums of the entries of W for each epsilon
+    """
+    data = np.ascontiguousarray(data, dtype=np.float64)
+    epsilons = np.ascontiguousarray(epsilons, dtype=np.float64)
+    npts, dim = data.shape
+    w_sums = np.empty(epsilons.shape[0])
+    status = _library().dmaps_test_kernels(data, npts, dim, epsilons, epsilons.shape[0], w_sums)
+    if status != 0:
+        raise RuntimeError('dmaps_test_kernels failed with status ' + str(status))
+    return w_sums
@@ -0,0 +1,95 @@
+"""Per-stage timing and memory instrumentation for the DMAPS embedding functions, used through their 'stats' argument
+
+Each stage records its wall-clock time, its CPU time summed over every thread of the process and over its child processes that have been waited for, so that multi-threaded BLAS calls and worker pools are fully accounted for, and the peak resident memory of the process and of its largest child when the stage ends.
+
+"""
+
+import contextlib
+import json
+import os
+import time
+try:
+    import resource
+except ImportError:
+    # not available on Windows, where memory is not recorded
+    resource = None
+
+def _peak_rss(children=False):
+    """Returns the peak resident set size so far in MB of the process, or if 'children' of the largest of its terminated and waited-for child processes, or None if it cannot be measured"""
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kB on Linux
+    return resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss/1024.0
+
+def _cpu_time():
+    """Returns the user and system time consumed so far by all threads of the process and by its terminated and waited-for child processes"""
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+class Stats:
+    """Records the cost of each stage of a DMAPS embedding
+
+    Attributes:
+        stages (list): one dictionary per completed stage, in the order they ran, holding the stage's 'name', 'wall' and 'cpu' times in seconds, the 'peak_rss' of the process in MB when it ended, the growth 'peak_rss_increase' of the peak during the stage, which is zero if the stage stayed below an earlier peak, and the 'children_peak_rss' of its largest child process. A stage that raises is recorded up to the exception.
+        info (dict): additional details reported by the stages, e.g. under 'solver' the iterations and residuals of the eigensolver (see 'dmaps_solvers')
+
+    >>> stats = Stats()
+    >>> eigvals, eigvects = dmaps.embed_data(data, k, epsilon=2.5, stats=stats)
+    >>> print stats.report()
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.info = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Records the code run within a 'with' block as the stage 'name'
+
+        >>> with stats.stage('kernel'):
+        ...     W = np.exp(-D*D/(epsilon*epsilon))
+        """
+        peak_rss = _peak_rss()
+        cpu = _cpu_time()
+        wall = time.time()
+        try:
+            yield
+        finally:
+            wall = time.time() - wall
+            cpu = _cpu_time() - cpu
+            peak_rss_increase = None
+            if peak_rss is not None:
+                peak_rss_increase = _peak_rss() - peak_rss
+                peak_rss += peak_rss_increase
+            self.stages.append({'name': name, 'wall': wall, 'cpu': cpu, 'peak_rss': peak_rss, 'peak_rss_increase': peak_rss_increase, 'children_peak_rss': _peak_rss(children=True)})
+
+    def total(self, field='wall'):
+        """Returns the sum of 'field', either "wall" or "cpu", over all stages"""
+        return sum(stage[field] for stage in self.stages)
+
+    def report(self):
+        """Returns a table of the recorded stages as a string"""
+        lines = ['%-16s %10s %10s %12s %12s %12s' % ('stage', 'wall (s)', 'cpu (s)', 'peak (MB)', 'growth (MB)', 'child (MB)')]
+        for stage in self.stages:
+            memory = ('%12.1f %12.1f %12.1f' % (stage['peak_rss'], stage['peak_rss_increase'], stage['children_peak_rss'])) if stage['peak_rss'] is not None else '%12s %12s %12s' % ('-', '-', '-')
+            lines.append('%-16s %10.4f %10.4f %s' % (stage['name'], stage['wall'], stage['cpu'], memory))
+        lines.append('%-16s %10.4f %10.4f' % ('total', self.total('wall'), self.total('cpu')))
+        return '\n'.join(lines)
+
+    def to_json(self):
+        """Returns the recorded stages and info as a JSON string, with any arrays in 'info' converted to lists"""
+        return json.dumps({'stages': self.stages, 'info': self.info}, default=lambda value: value.tolist())
+
+@contextlib.contextmanager
+def _null_stage():
+    yield
+
+def stage(stats, name):
+    """Returns a context manager recording the stage 'name' in 'stats', or doing nothing if 'stats' is None, so that instrumented functions need not test for it
+
+    >>> with dmaps_profile.stage(stats, 'eigensolve'):
+    ...     eigvals, eigvects = spla.eigsh(A, k)
+    """
+    if stats is None:
+        return _null_stage()
+    return stats.stage(name)
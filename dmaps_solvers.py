@@ -0,0 +1,156 @@
+"""Partial eigensolvers used by the DMAPS embedding functions to find the leading eigenpairs of the normalized kernel matrix
+
+Each solver is called as solver(A, k, symmetric, v0, **options) where 'A' is a (typically matrix-free) scipy.sparse.linalg.LinearOperator, and returns the eigenvalues, the eigenvectors and a dictionary describing the solve with the entries
+
+    - 'solver': the name of the solver
+    - 'iterations': the number of iterations (for ARPACK, the number of products with 'A', as scipy does not report restarts)
+    - 'matvecs': the number of products of 'A' with a single vector, counting each column of a block product
+    - 'residuals': shape (k) vector of :math:`\|A v_i - \lambda_i v_i\|` for each computed eigenpair
+    - 'converged': whether every eigenpair met the solver's tolerance within its iteration limit. ARPACK raises scipy.sparse.linalg.ArpackNoConvergence instead, while the other solvers return their last iterates.
+
+so that backends can be compared, or selected by name through the 'solver' argument of 'dmaps.embed_data'.
+
+"""
+
+import warnings
+import numpy as np
+import scipy.linalg
+import scipy.sparse.linalg as spla
+
+class _counting_operator:
+    """Wraps a LinearOperator, counting the number of vectors it is applied to
+
+    Attributes:
+        matvecs (int): the number of vectors 'A' has been applied to so far
+    """
+
+    def __init__(self, A):
+        self._A = A
+        self.matvecs = 0
+
+    def matvec(self, x):
+        self.matvecs += 1
+        return self._A.matvec(x)
+
+    def matmat(self, X):
+        self.matvecs += X.shape[1]
+        return self._A.matmat(X)
+
+    def operator(self):
+        """Returns a LinearOperator that counts its applications in 'matvecs'"""
+        return spla.LinearOperator(self._A.shape, matvec=self.matvec, matmat=self.matmat, dtype=self._A.dtype)
+
+def _residuals(A, eigvals, eigvects):
+    """Returns the norms :math:`\|A v_i - \lambda_i v_i\|` of the residuals of each eigenpair"""
+    return np.linalg.norm(A.matmat(eigvects) - eigvects*eigvals, axis=0)
+
+def _start_block(v0, n, ncols, random_state):
+    """Builds an (n, ncols) block of starting vectors from the columns of 'v0', a vector or block of initial guesses, completed with random columns"""
+    block = random_state.standard_normal((n, ncols))
+    if v0 is not None:
+        v0 = np.real(np.asarray(v0)).reshape(n, -1)[:, :ncols]
+        block[:, :v0.shape[1]] = v0
+    return block
+
+def arpack(A, k, symmetric=True, v0=None, tol=0, maxiter=None, ncv=None, which='LM'):
+    """Computes 'k' eigenpairs with the implicitly restarted Lanczos (if 'symmetric') or Arnoldi method of ARPACK, through scipy's eigsh and eigs
+
+    Args:
+        A (LinearOperator): shape (n, n) operator
+        k (int): the number of eigenpairs to compute
+        symmetric (bool): whether 'A' is symmetric
+        v0 (array): starting vector, or an (n, j) block of initial guesses whose sum is used as the starting vector. If None, a random vector is used.
+        tol (float): relative accuracy of the eigenvalues, with 0 meaning machine precision
+        maxiter (int): the maximum number of restarts
+        ncv (int): the number of Lanczos/Arnoldi vectors, see scipy.sparse.linalg.eigsh
+        which (string): which eigenvalues to find, see scipy.sparse.linalg.eigsh
+
+    Returns:
+        eigvals (array): shape (k) vector of eigenvalues, in no particular order
+        eigvects (array): shape (n, k) array of the corresponding eigenvectors
+        info (dict): description of the solve, see the module documentation
+    """
+    counter = _counting_operator(A)
+    if v0 is not None and np.ndim(v0) == 2:
+        v0 = np.sum(np.real(v0), 1)
+    eigensolver = spla.eigsh if symmetric else spla.eigs
+    eigvals, eigvects = eigensolver(counter.operator(), k=k, v0=v0, tol=tol, maxiter=maxiter, ncv=ncv, which=which)
+    info = {'solver': 'arpack', 'iterations': counter.matvecs, 'matvecs': counter.matvecs, 'residuals': _residuals(A, eigvals, eigvects), 'converged': True}
+    return eigvals, eigvects, info
+
+def lobpcg(A, k, symmetric=True, v0=None, tol=1e-6, maxiter=500, seed=None):
+    """Computes the 'k' algebraically largest eigenpairs with the locally optimal block preconditioned conjugate gradient method. Unlike ARPACK, the whole block of initial guesses is used, so warm starts from the eigenvectors of a closely related operator are very effective.
+
+    .. note::
+        For the default DMAPS kernel the normalized kernel matrix is positive semi-definite, so its algebraically largest eigenvalues are also those of largest magnitude.
+
+    Args:
+        A (LinearOperator): shape (n, n) symmetric operator
+        k (int): the number of eigenpairs to compute
+        symmetric (bool): must be True
+        v0 (array): an (n, j) block, or a single vector, of initial guesses, completed with random vectors up to 'k' columns
+        tol (float): absolute residual tolerance, which for the leading DMAPS eigenvalues, of order one, is close to a relative one. If None, scipy's default of :math:`\sqrt{10^{-15}} n` is used.
+        maxiter (int): the maximum number of iterations, at most 'n'
+        seed (int): seed for the random initial vectors
+
+    Returns:
+        eigvals (array): shape (k) vector of eigenvalues, in no particular order
+        eigvects (array): shape (n, k) array of the corresponding eigenvectors
+        info (dict): description of the solve, see the module documentation
+    """
+    if not symmetric:
+        raise ValueError('lobpcg requires a symmetric operator')
+    counter = _counting_operator(A)
+    X = _start_block(v0, A.shape[0], k, np.random.RandomState(seed))
+    eigvals, eigvects, residual_history = spla.lobpcg(counter.operator(), X, tol=tol, maxiter=maxiter, largest=True, retResidualNormsHistory=True)
+    if tol is None:
+        tol = np.sqrt(1e-15)*A.shape[0]
+    # as in scipy, an eigenpair has converged once its residual has fallen below 'tol' in any iteration
+    converged = bool(np.all(np.min(residual_history, axis=0) <= tol))
+    info = {'solver': 'lobpcg', 'iterations': len(residual_history), 'matvecs': counter.matvecs, 'residuals': _residuals(A, eigvals, eigvects), 'converged': converged}
+    return eigvals, eigvects, info
+
+def randomized(A, k, symmetric=True, v0=None, tol=1e-6, maxiter=500, oversampling=10, seed=None):
+    """Computes the 'k' eigenpairs of largest magnitude with randomized subspace iteration: a block of 'k' + 'oversampling' vectors is repeatedly multiplied by 'A' and orthonormalized, and the eigenpairs are extracted from the subspace by the Rayleigh-Ritz procedure until their residuals fall below 'tol'. Each iteration costs a single block product, which is efficient when the products with 'A' are dense matrix products.
+
+    Args:
+        A (LinearOperator): shape (n, n) symmetric operator
+        k (int): the number of eigenpairs to compute
+        symmetric (bool): must be True
+        v0 (array): an (n, j) block, or a single vector, of initial guesses, completed with random vectors up to 'k' + 'oversampling' columns
+        tol (float): residual tolerance relative to the magnitude of each eigenvalue
+        maxiter (int): the maximum number of iterations, after which the last iterates are returned with a warning
+        oversampling (int): the number of additional vectors in the subspace, which speed up convergence when the eigenvalues are clustered
+        seed (int): seed for the random initial vectors
+
+    Returns:
+        eigvals (array): shape (k) vector of eigenvalues, sorted from largest to smallest magnitude
+        eigvects (array): shape (n, k) array of the corresponding eigenvectors
+        info (dict): description of the solve, see the module documentation
+    """
+    if not symmetric:
+        raise ValueError('randomized subspace iteration requires a symmetric operator')
+    n = A.shape[0]
+    counter = _counting_operator(A)
+    Q, _ = np.linalg.qr(_start_block(v0, n, min(k + oversampling, n), np.random.RandomState(seed)))
+    converged = False
+    for iteration in xrange(1, maxiter + 1):
+        Z = counter.matmat(Q)
+        # Rayleigh-Ritz on the current subspace
+        ritz_vals, ritz_vects = scipy.linalg.eigh(np.dot(Q.T, Z))
+        order = np.argsort(np.abs(ritz_vals))[::-1][:k]
+        eigvals, U = ritz_vals[order], ritz_vects[:, order]
+        eigvects = np.dot(Q, U)
+        # A Q U = Z U, so the residuals need no further products with A
+        residuals = np.linalg.norm(np.dot(Z, U) - eigvects*eigvals, axis=0)
+        converged = bool(np.all(residuals <= tol*np.abs(eigvals)))
+        if converged:
+            break
+        Q, _ = np.linalg.qr(Z)
+    if not converged:
+        warnings.warn('randomized subspace iteration did not converge to tol=%g within %d iterations' % (tol, maxiter))
+    info = {'solver': 'randomized', 'iterations': iteration, 'matvecs': counter.matvecs, 'residuals': residuals, 'converged': converged}
+    return eigvals, eigvects, info
+
+# the solvers selectable by name
+solvers = {'arpack': arpack, 'lobpcg': lobpcg, 'randomized': randomized}
@@ -1,6 +1,10 @@
 #ifndef _GAUSSIAN_KERNEL_H_
 #define _GAUSSIAN_KERNEL_H_
 
+#include <cmath>
+#include <vector>
+#include <Eigen/Dense>
+
 /**
  * \class Kernel_Function
  *
@@ -33,6 +37,17 @@ class Kernel_Function {
     }
     return std::exp(-norm/(_epsilon*_epsilon));
   }
+  /**
+   * Calculates the Gaussian kernel between two Eigen vectors or matrix rows, e.g. rows of an Eigen::Map over a NumPy array, without copying them
+   *
+   * \param x1 first vector
+   * \param x2 second vector
+   * \returns \f$k(x,y)=e^{\frac{-\| x-y \|^2}{\epsilon^2}}\f$
+   */
+  template <typename Derived1, typename Derived2>
+  double operator()(const Eigen::MatrixBase<Derived1>& x1, const Eigen::MatrixBase<Derived2>& x2) const {
+    return std::exp(-(x1 - x2).squaredNorm()/(_epsilon*_epsilon));
+  }
  private:
   const double _epsilon; ///< DMAPS parameter defining a points neighborhood: only those points within approximately distance _epsilon will be considered neighbors
 };
@@ -8,6 +8,9 @@ import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
 import matplotlib.colorbar as colorbar
+from matplotlib.colors import LogNorm
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 
 def plot_xyz(x, y, z, xlabel="x", ylabel="y", zlabel="z", color='b', filename=False, hide_ticks=False, colorbar=False, labelsize=0, **kwargs):
     """Plots three-dimensional data
@@ -113,3 +116,116 @@ def plot_embeddings(eigvects, eigvals, k='all', t=1, plot_2d=True, plot_3d=False
                 else:
                     plot_xy(np.power(eigvals[i], t)*eigvects[:,i], np.power(eigvals[j], t)*eigvects[:,j], xlabel=xlabel, ylabel=ylabel, s=50, scatter=True, hide_ticks=True, **kwargs)
 
+def _grid_cells(x, y, gridsize):
+    """Returns the index ix*'gridsize' + iy of the cell of a 'gridsize' by 'gridsize' grid spanning the points ('x', 'y') that contains each point"""
+    def bins(values):
+        span = np.ptp(values)
+        return np.minimum((gridsize*(values - np.min(values))/(span if span > 0 else 1)).astype(int), gridsize - 1)
+    return bins(x)*gridsize + bins(y)
+
+def _stratified_subset(x, y, max_points, gridsize=100, random_state=np.random):
+    """Selects at most 'max_points' of the points ('x', 'y') by stratified sampling: the points are binned on a 'gridsize' by 'gridsize' grid and each point of a cell is kept with a probability chosen so that, on average, at most the same number of points is kept from every cell, so that dense regions are thinned while sparse ones and outliers are kept. Unlike sampling a fixed number per cell, this needs no sort, and so takes time linear in the number of points.
+
+    Args:
+        x (array): shape (n) vector of x values
+        y (array): shape (n) vector of y values
+        max_points (int): the maximum number of points to keep
+        gridsize (int): the number of cells along each axis
+        random_state (numpy.random.RandomState): random number generator choosing the points kept in each cell
+
+    Returns:
+        indices (array): sorted indices of the kept points
+    """
+    n = x.shape[0]
+    if n <= max_points:
+        return np.arange(n)
+    cells = _grid_cells(x, y, gridsize)
+    cell_counts = np.bincount(cells)
+    # the largest per-cell quota q keeping at most max_points, where keeping up to q points of every cell keeps sum(min(count, q)) points
+    counts = np.sort(cell_counts[cell_counts > 0])
+    kept = np.cumsum(counts) + counts*np.arange(counts.shape[0] - 1, -1, -1)
+    last = np.searchsorted(kept, max_points, side='right') - 1
+    if last < 0:
+        quota = max_points/float(counts.shape[0])
+    else:
+        # spread the remaining points evenly over the cells fuller than the quota
+        quota = counts[last] + (max_points - kept[last])/float(max(np.sum(counts > counts[last]), 1))
+    # keep min(count, quota) points of each cell on average
+    indices = np.flatnonzero(random_state.uniform(size=n)*cell_counts[cells] < quota)
+    if indices.shape[0] > max_points:
+        # sampling noise, or more occupied cells than points to keep
+        indices = random_state.choice(indices, max_points, replace=False)
+    return np.sort(indices)
+
+def _density_image(x, y, gridsize=100, values=None):
+    """Bins the points ('x', 'y') on a 'gridsize' by 'gridsize' grid
+
+    Args:
+        x (array): shape (n) vector of x values
+        y (array): shape (n) vector of y values
+        gridsize (int): the number of cells along each axis
+        values (array): if given, a shape (n) vector whose mean over the points of each cell is returned instead of their number
+
+    Returns:
+        image (numpy.ma.MaskedArray): shape (gridsize, gridsize) array of the number of points (or mean of 'values') in each cell, with y along its rows and empty cells masked, ready for imshow(origin='lower')
+        extent (list): the [xmin, xmax, ymin, ymax] spanned by the grid
+    """
+    cells = _grid_cells(x, y, gridsize)
+    counts = np.bincount(cells, minlength=gridsize*gridsize)
+    image = counts if values is None else np.bincount(cells, weights=values, minlength=gridsize*gridsize)/np.maximum(counts, 1)
+    image = np.ma.masked_array(image, counts == 0).reshape(gridsize, gridsize).T
+    return image, [np.min(x), np.max(x), np.min(y), np.max(y)]
+
+def plot_embeddings_grid(eigvects, eigvals, k='all', t=1, filename=False, color='b', max_points=20000, method='decimate', gridsize=100, panel_size=3, dpi=100, seed=0, **kwargs):
+    """Draws the "k Choose 2" different 2d embeddings based on the top 'k' eigenvectors from DMAPS as panels of a single figure, without a display. The panel of eigenvectors i and j lies in row j-2 and column i-1 of the lower triangle of the grid. Above 'max_points' points, each panel shows either a stratified subset of the points or an image of their density, and points are rasterized, so that drawing time and file size stay roughly constant however large the embedding.
+
+    Args:
+        eigvects (array): columns contain DMAPS eigenvectors used to embed data
+        eigvals (array): DMAPS eigenvalues, sorted in order of decreasing magnitude
+        k (int, 'all'): either an integer corresponding to the number of eigenvectors to consider or 'all' which considers all combinations
+        t (float): the time parameter in DMAPS, typically one in our work
+        filename (str, optional): if specified, the figure is saved to this file, in a format given by its extension
+        color (str, array): a single color, or a shape (n) vector of values colored by 'cmap' (passed in 'kwargs')
+        max_points (int): the number of points above which panels are decimated or binned
+        method (str): either "decimate", plotting a subset of at most 'max_points' points chosen by '_stratified_subset' for each panel, or "density", shading the cells of a 'gridsize' by 'gridsize' grid by the logarithm of the number of points (or, if 'color' is a vector, by its mean value) within them
+        gridsize (int): the number of cells along each axis used for stratification or density images
+        panel_size (float): the width and height of each panel in inches
+        dpi (int): resolution of the saved figure
+        seed (int): seed for the random number generator used in decimation
+
+    Returns:
+        fig (matplotlib.figure.Figure): the figure, attached to an Agg canvas so that it can be saved again in other formats
+
+    >>> plot_embeddings_grid(eigvects, eigvals, k=6, filename='embeddings.png', color=eigvects[:,1], cmap='jet')
+    """
+    if method not in ('decimate', 'density'):
+        raise ValueError('unknown method ' + repr(method))
+    if k is 'all':
+        k = eigvals.shape[0]
+    n = eigvects.shape[0]
+    random_state = np.random.RandomState(seed)
+    vector_color = not isinstance(color, str) and np.ndim(color) == 1
+    coords = eigvects[:,:k]*np.power(eigvals[:k], t)
+    npanels = max(k - 2, 1)
+    fig = Figure(figsize=(panel_size*npanels, panel_size*npanels))
+    FigureCanvasAgg(fig)
+    for i in range(1, k):
+        for j in range(i+1, k):
+            ax = fig.add_subplot(npanels, npanels, (j - 2)*npanels + i)
+            x, y = coords[:,i], coords[:,j]
+            if n > max_points and method == 'density':
+                image, extent = _density_image(x, y, gridsize, np.asarray(color, dtype=float) if vector_color else None)
+                ax.imshow(image, origin='lower', extent=extent, aspect='auto', interpolation='nearest', norm=(None if vector_color else LogNorm()), **kwargs)
+            else:
+                indices = _stratified_subset(x, y, max_points, gridsize, random_state)
+                ax.scatter(x[indices], y[indices], c=(np.asarray(color)[indices] if vector_color else color), s=max(1, 50*min(1.0, 1000.0/max(indices.shape[0], 1))), lw=0, rasterized=True, **kwargs)
+            ax.set_xticks([])
+            ax.set_yticks([])
+            if i == 1:
+                ax.set_ylabel(r'$\Phi_{' + str(j) + '}$')
+            if j == k - 1:
+                ax.set_xlabel(r'$\Phi_{' + str(i) + '}$')
+    fig.tight_layout()
+    if filename is not False:
+        fig.savefig(filename, dpi=dpi)
+    return fig
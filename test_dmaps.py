@@ -1,7 +1,8 @@
 import numpy as np
 import dmaps
+import dmaps_native
+import dmaps_profile
 import plot_dmaps
-import time
 
 def gen_swissroll(n_thetas=20, n_zvals=20, var=0.5):
     """Generates a swissroll dataset in three dimensions
@@ -23,6 +24,50 @@ def gen_swissroll(n_thetas=20, n_zvals=20, var=0.5):
     swissroll[:,2] = zvals
     return swissroll
 
+def _assert_embeddings_agree(eigvals, eigvects, other_eigvals, other_eigvects, eigval_tol, cosine_tol):
+    """Asserts that two embeddings have eigenvalues within 'eigval_tol' and eigenvectors, which are normalized, with absolute cosines within 'cosine_tol' of one"""
+    assert np.max(np.abs(eigvals - other_eigvals)) < eigval_tol
+    assert np.min(np.abs(np.sum(eigvects*other_eigvects, 0))) > 1 - cosine_tol
+
+def test_float32_agreement():
+    """Checks that storing W in single precision reproduces the double precision embedding of a small swissroll, from both double and single precision data"""
+    np.random.seed(0)
+    data = gen_swissroll()[:1000]
+    k = 6; epsilon = 3.0
+    eigvals, eigvects = dmaps.embed_data(data, k, epsilon=epsilon)
+    eigvals32, eigvects32 = dmaps.embed_data(data, k, epsilon=epsilon, dtype=np.float32)
+    _assert_embeddings_agree(eigvals, eigvects, eigvals32, eigvects32, 1e-5, 1e-5)
+    # single precision data, whose distances are still computed in double precision
+    data32 = data.astype(np.float32)
+    eigvals, eigvects = dmaps.embed_data(data32.astype(np.float64), k, epsilon=epsilon)
+    eigvals32, eigvects32 = dmaps.embed_data(data32, k, epsilon=epsilon, dtype=np.float32)
+    _assert_embeddings_agree(eigvals, eigvects, eigvals32, eigvects32, 1e-5, 1e-5)
+
+def test_native_agreement():
+    """Checks that the native C++ backend reproduces the numpy embedding of a small swissroll. Skipped if the shared library has not been built (make libdmaps.so)."""
+    if not dmaps_native.available():
+        try:
+            import pytest
+        except ImportError:
+            return
+        pytest.skip('native backend not built')
+    np.random.seed(0)
+    data = gen_swissroll()[:500]
+    k = 6
+    eigvals, eigvects = dmaps.embed_data(data, k)
+    native_eigvals, native_eigvects = dmaps.embed_data(data, k, dtype='float64', backend='native')
+    _assert_embeddings_agree(eigvals, eigvects, native_eigvals, native_eigvects, 1e-8, 1e-8)
+
+def test_epsilon_sweep_sums():
+    """Checks the binned kernel sums of 'dmaps.epsilon_sweep' against summing the kernel matrix at each epsilon, including duplicate points and near-duplicates at roundoff-level distances"""
+    np.random.seed(0)
+    data = gen_swissroll()[:500]
+    data = np.concatenate((data, data[:10], data[10:20] + 1e-9*np.random.randn(10, 3)))
+    epsilons = np.logspace(-2, 3, 20)
+    squared_distances = dmaps._pairwise_distances(data)**2
+    w_sums = np.array([np.sum(np.exp(-squared_distances/(epsilon*epsilon))) for epsilon in epsilons])
+    assert np.max(np.abs(dmaps.epsilon_sweep(data, epsilons)[0] - w_sums)/w_sums) < 1e-9
+
 def dmaps_demo():
     """Demonstrates the DMAPS algorithm on a swissroll dataset using a predefined epsilon value"""
 
@@ -34,22 +79,19 @@ def dmaps_demo():
     # investigate proper epsilon
     print 'Investigating effect of epsilon on embedding'
     dmaps.epsilon_plot(data)
-    start = time.clock()
     k = 4
     print 'Computing embedding'
-    eigvals, eigvects = dmaps.embed_data(data, k, epsilon=epsilon)
+    stats = dmaps_profile.Stats()
+    eigvals, eigvects = dmaps.embed_data(data, k, epsilon=epsilon, stats=stats)
+
+    np.save('./eigvects.npy', eigvects)
+    np.save('./eigvals.npy', eigvals)
+    np.save('./data.npy', data)
 
-    np.savetxt('./eigvects.csv', eigvects, delimiter=',')
-    np.savetxt('./eigvals.csv', eigvals, delimiter=',')
-    np.savetxt('./data.csv', data, delimiter=',')
-
-    print 'Lanczos solver took', str(time.clock() - start) + 's', 'to find top', k, 'eigenvectors'
-    print 'Displaying dmaps embeddings'
-    for i in range(1, k):
-        for j in range(i+1, k):
-            xlabel = r'$\Phi_{' + str(i+1) + '}$'
-            ylabel = r'$\Phi_{' + str(j+1) + '}$'
-            plot_dmaps.plot_xy(eigvals[i]*eigvects[:,i], eigvals[j]*eigvects[:,j], xlabel=xlabel, ylabel=ylabel, title='Embedding dataset with ' + xlabel + ' and ' + ylabel, color=eigvects[:,2], s=50, scatter=True, hide_ticks=True, cmap='jet')
+    print 'Lanczos solver took', str(stats.stages[-1]['wall']) + 's', 'to find top', k, 'eigenvectors'
+    print stats.report()
+    print 'Saving dmaps embeddings to dmaps_embeddings.png'
+    plot_dmaps.plot_embeddings_grid(eigvects, eigvals, k=k, filename='./dmaps_embeddings.png', color=eigvects[:,2], cmap='jet')
 
 if __name__=="__main__":
     # print 'no'